@@ -3,10 +3,227 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import functools
+import io
 import os
-from typing import Protocol
+from collections.abc import Collection, Generator
+from contextlib import contextmanager
+from typing import Any, NamedTuple, Protocol, cast
 
-AVRO_CODEC = os.environ.get("AVRO_CODEC", "deflate")
+from avro.codecs import KNOWN_CODECS, get_codec
+from avro.datafile import (
+    CODEC_KEY,
+    MAGIC,
+    META_SCHEMA,
+    SCHEMA_KEY,
+    SYNC_SIZE,
+    DataFileReader,
+    DataFileWriter,
+)
+from avro.errors import AvroException
+from avro.io import BinaryDecoder, BinaryEncoder, DatumReader
+from avro.schema import RecordSchema, Schema, parse
+from avrokit import URL, avro_schema, avro_writer
+
+# Snappy compresses HTML nearly as well as deflate at a fraction of the CPU cost, but avro
+# only registers it when python-snappy is installed
+DEFAULT_AVRO_CODEC = "snappy" if "snappy" in KNOWN_CODECS else "deflate"
+AVRO_CODEC = os.environ.get("AVRO_CODEC", DEFAULT_AVRO_CODEC)
+AVRO_BATCH_SIZE = 16
+# Blocks are also closed once this many bytes are buffered. Readers refuse to decompress
+# blocks larger than 200 MiB (see avro.codecs.DEFAULT_MAX_DECOMPRESS_LENGTH).
+AVRO_MAX_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+@contextmanager
+def avro_projected_reader(
+    url: URL, fields: Collection[str]
+) -> Generator[DataFileReader, None, None]:
+    """
+    Open an Avro reader that only decodes the given top-level record fields.
+
+    The other fields (e.g. a page body) are skipped over in the file instead of being
+    decoded. If the file's schema can't be projected, full records are returned.
+
+    :param url: The URL of the Avro file to read.
+    :param fields: Names of the fields to read.
+    :return: A DataFileReader yielding records with only the given fields.
+    """
+    with url as f, DataFileReader(f, DatumReader()) as reader:
+        writers_schema = reader.datum_reader.writers_schema
+        if isinstance(writers_schema, RecordSchema):
+            schema = cast(dict[str, Any], writers_schema.to_json())
+            schema["fields"] = [
+                field for field in schema["fields"] if field["name"] in fields
+            ]
+            try:
+                reader.datum_reader.readers_schema = avro_schema(schema)
+            except AvroException:
+                # E.g. a kept field refers to a named type defined by a dropped one
+                pass
+        yield reader
+
+
+class AvroBlock(NamedTuple):
+    """
+    An encoded (and possibly compressed) block of records from an Avro data file.
+    """
+
+    schema: str
+    codec: str
+    count: int
+    data: bytes
+
+
+def avro_block_reader(url: URL) -> Generator[AvroBlock, None, None]:
+    """
+    Read the blocks of an Avro data file without decoding their records.
+
+    :param url: The URL of the Avro file to read.
+    :return: A generator of the file's blocks, to be decoded with decode_avro_block.
+    """
+    with url as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        decoder = BinaryDecoder(f)
+        header = cast(
+            dict[str, Any], DatumReader().read_data(META_SCHEMA, META_SCHEMA, decoder)
+        )
+        if header.get("magic") != MAGIC:
+            raise AvroException(f"Not an Avro data file: {url}")
+        meta = header["meta"]
+        schema = meta[SCHEMA_KEY].decode()
+        codec = meta.get(CODEC_KEY, b"null").decode()
+        while f.tell() < end:
+            count = decoder.read_long()
+            data = decoder.read_bytes()
+            if decoder.read(SYNC_SIZE) != header["sync"]:
+                raise AvroException(f"Sync marker mismatch in {url}")
+            yield AvroBlock(schema, codec, count, data)
+
+
+@functools.lru_cache
+def _parse_schema(schema: str) -> Schema:
+    return parse(schema)
+
+
+def decode_avro_block(block: AvroBlock) -> list[object]:
+    """
+    Decode the records of a block read by avro_block_reader.
+
+    :param block: The block to decode.
+    :return: The records in the block.
+    """
+    # The codecs read the block data length-prefixed, as it is stored in the file
+    buffer = io.BytesIO()
+    BinaryEncoder(buffer).write_bytes(block.data)
+    buffer.seek(0)
+    decoder = get_codec(block.codec).decompress(BinaryDecoder(buffer))
+    datum_reader = DatumReader(_parse_schema(block.schema))
+    return [datum_reader.read(decoder) for _ in range(block.count)]
+
+
+def available_cpus() -> int:
+    """
+    Get the number of CPUs this process may run on.
+
+    Unlike os.cpu_count(), this respects CPU affinity (e.g. taskset, or a container's
+    cpuset) where the platform supports it.
+
+    :return: The number of usable CPUs, at least 1.
+    """
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        # Not available on macOS or Windows
+        return os.cpu_count() or 1
+
+
+class BatchedAvroWriter:
+    """
+    Buffer records and write every batch of them to the file as a single Avro block.
+
+    DataFileWriter closes a block as soon as it grows past its sync interval, so records
+    with a large body (e.g. a crawled page) would otherwise each get a block of their own.
+    """
+
+    def __init__(
+        self,
+        writer: DataFileWriter,
+        batch_size: int = AVRO_BATCH_SIZE,
+        max_block_bytes: int = AVRO_MAX_BLOCK_BYTES,
+    ):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.max_block_bytes = max_block_bytes
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of records buffered for the next block.
+        """
+        return self.writer.block_count
+
+    def append(self, datum: object) -> None:
+        """
+        Encode a record into the current block, writing the block out once it is full.
+
+        An invalid record raises here, and leaves the buffered records untouched.
+
+        :param datum: The record to write.
+        :raises AvroTypeException: If the record doesn't match the schema.
+        """
+        buffer = self.writer.buffer_writer
+        position = buffer.tell()
+        try:
+            self.writer.datum_writer.write(datum, self.writer.buffer_encoder)
+        except Exception:
+            # Drop whatever part of the record was encoded before the error
+            buffer.truncate(position)
+            buffer.seek(position)
+            raise
+        self.writer.block_count += 1
+        if (
+            self.writer.block_count >= self.batch_size
+            or buffer.tell() >= self.max_block_bytes
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered records to the file as one block.
+        """
+        if self.writer.block_count > 0:
+            self.writer.flush()
+
+
+@contextmanager
+def batched_avro_writer(
+    url: URL,
+    schema: Schema | None = None,
+    codec: str = AVRO_CODEC,
+    batch_size: int = AVRO_BATCH_SIZE,
+    max_block_bytes: int = AVRO_MAX_BLOCK_BYTES,
+) -> Generator[BatchedAvroWriter, None, None]:
+    """
+    Open an Avro writer that writes records in blocks of batch_size.
+
+    Buffered records are written out when the writer is closed, including on error.
+
+    :param url: The URL of the Avro file to write.
+    :param schema: The Avro schema to use for writing.
+    :param codec: The compression codec to use.
+    :param batch_size: The number of records per block.
+    :param max_block_bytes: The (uncompressed) size at which a block is written out
+        early, to keep blocks readable.
+    :return: A BatchedAvroWriter.
+    """
+    with avro_writer(url, schema, codec=codec) as writer:
+        batched = BatchedAvroWriter(writer, batch_size, max_block_bytes)
+        try:
+            yield batched
+        finally:
+            batched.flush()
 
 
 class Tool(Protocol):
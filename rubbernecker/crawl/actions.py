@@ -5,7 +5,7 @@
 import logging
 import re
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Protocol
 
@@ -127,8 +127,9 @@ ACTIONS: list[CrawlAction] = [
     ClickIfExistsCrawlAction(),
 ]
 
-ACTION_NAMES: dict[CrawlActionName, CrawlAction] = {
-    action.name(): action for action in ACTIONS
+# Keyed by the action name's string value so script lines resolve with a single lookup
+ACTION_NAMES: dict[str, CrawlAction] = {
+    action.name().value: action for action in ACTIONS
 }
 
 
@@ -136,21 +137,73 @@ def crawl_action(action_name: CrawlActionName) -> CrawlAction:
     """
     Get the crawl action by name.
     """
-    action = ACTION_NAMES.get(action_name)
+    action = ACTION_NAMES.get(action_name.value)
     if action is None:
         raise ValueError(f"Unknown action: {action_name}")
     return action
 
 
-@dataclass
+# Characters that stand for themselves in a pattern, and those that do once escaped
+_LITERAL_CHARS = frozenset("/:_-=&%~@,;!'\"<>#")
+_ESCAPED_LITERAL_CHARS = frozenset(".^$*+?{}[]()|\\/-:")
+
+
+def _literal_prefix(url_pattern: re.Pattern) -> tuple[str, bool]:
+    """
+    Extract the literal text that every match of the pattern starts with.
+
+    :param url_pattern: The compiled URL pattern.
+    :return: The literal (possibly empty) and whether the pattern is anchored with "^".
+    """
+    source = url_pattern.pattern
+    # Alternation and flags change what the leading text means, so don't guess
+    if url_pattern.flags != re.UNICODE or "|" in source:
+        return "", False
+    anchored = source.startswith("^")
+    i = 1 if anchored else 0
+    literal: list[str] = []
+    while i < len(source):
+        c = source[i]
+        if (
+            c == "\\"
+            and i + 1 < len(source)
+            and source[i + 1] in _ESCAPED_LITERAL_CHARS
+        ):
+            literal.append(source[i + 1])
+            i += 2
+        elif c.isalnum() or c in _LITERAL_CHARS:
+            literal.append(c)
+            i += 1
+        else:
+            break
+    # An optional or repeated last character isn't guaranteed to appear
+    if literal and i < len(source) and source[i] in "?*{":
+        literal.pop()
+    return "".join(literal), anchored
+
+
+@dataclass(slots=True)
 class CrawlActionPlan:
     url_pattern: re.Pattern
     actions: list[tuple[CrawlAction, list[str]]]
+    # Literal text a matching URL must contain (or start with, if anchored)
+    _literal: str = field(init=False, repr=False, compare=False)
+    _anchored: bool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self._literal, self._anchored = _literal_prefix(self.url_pattern)
 
     def should_run(self, url: str) -> bool:
         """
         Check if the action plan should run for the given URL.
         """
+        # Cheap string check first; most URL/plan pairs don't match
+        if self._literal:
+            if self._anchored:
+                if not url.startswith(self._literal):
+                    return False
+            elif self._literal not in url:
+                return False
         return self.url_pattern.search(url) is not None
 
     def run(self, driver: CrawlDriver) -> bool:
@@ -161,34 +214,71 @@ class CrawlActionPlan:
         :return: True if the actions were run successfully, False otherwise.
         """
         for action, args in self.actions:
-            if not action.run(driver, args):
+            if not action.run(driver, args=args):
                 return False
         return True
 
 
+# Backreferences are renumbered when patterns are combined, so such patterns are matched alone
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class CrawlActionPlanSet:
+    """
+    A list of crawl action plans matched against URLs as a group.
+
+    All of the plans' URL patterns are combined into a single alternation, so a URL that
+    matches none of the plans is rejected with one regex search instead of one per plan.
+    """
+
+    def __init__(self, plans: list[CrawlActionPlan]) -> None:
+        self.plans = plans
+        self._combined: re.Pattern | None = None
+        patterns = [plan.url_pattern for plan in plans]
+        if patterns and all(
+            pattern.flags == re.UNICODE and not _BACKREFERENCE.search(pattern.pattern)
+            for pattern in patterns
+        ):
+            try:
+                self._combined = re.compile(
+                    "|".join(f"(?:{pattern.pattern})" for pattern in patterns)
+                )
+            except re.error:
+                # E.g. duplicate group names or inline global flags; match plans individually
+                pass
+
+    def matching(self, url: str) -> list[CrawlActionPlan]:
+        """
+        Get the plans that should run for the given URL, in order.
+        """
+        if self._combined is not None and self._combined.search(url) is None:
+            return []
+        return [plan for plan in self.plans if plan.should_run(url)]
+
+
 def parse_crawl_action_plans(script: str) -> list[CrawlActionPlan]:
     """
     Parse a string of crawl actions into a dictionary of action names and their arguments.
     """
     acc: list[CrawlActionPlan] = []
-    cur: CrawlActionPlan | None = None
+    url_pattern: re.Pattern | None = None
+    actions: list[tuple[CrawlAction, list[str]]] = []
     for line in script.strip().splitlines():
         line = line.strip()
-        if line.startswith("[") and line.endswith("]"):
-            if cur is not None:
-                acc.append(cur)
-            cur = CrawlActionPlan(
-                url_pattern=re.compile(line[1:-1]),
-                actions=[],
-            )
-        elif cur is not None:
-            parts = line.split()
-            action_name = CrawlActionName(parts[0].upper())
-            action_args = parts[1:]
-            action = ACTION_NAMES.get(action_name)
+        if not line:
+            continue
+        if line[0] == "[" and line[-1] == "]":
+            if url_pattern is not None:
+                acc.append(CrawlActionPlan(url_pattern=url_pattern, actions=actions))
+            url_pattern = re.compile(line[1:-1])
+            actions = []
+        elif url_pattern is not None:
+            name, *rest = line.split(maxsplit=1)
+            action = ACTION_NAMES.get(name.upper())
             if action is None:
-                raise ValueError(f"Unknown action: {action_name}")
-            cur.actions.append((action, action_args))
-    if cur is not None:
-        acc.append(cur)
+                raise ValueError(f"Unknown action: {name}")
+            action_args = rest[0].split() if rest else []
+            actions.append((action, action_args))
+    if url_pattern is not None:
+        acc.append(CrawlActionPlan(url_pattern=url_pattern, actions=actions))
     return acc
@@ -2,39 +2,85 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import functools
 import hashlib
 import math
-from collections.abc import Generator
+import struct
+from collections.abc import Generator, Iterable
+from typing import IO
+
+try:
+    from xxhash import xxh3_128_intdigest
+except ImportError:
+    HAS_XXHASH = False
+else:
+    HAS_XXHASH = True
+
+
+def _blake2b_128_intdigest(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=16).digest(), "little")
+
+
+# 128-bit hash functions by name. xxh3 is several times faster than blake2b, but is only
+# available when xxhash is installed.
+HASH_FUNCTIONS = {"blake2b": _blake2b_128_intdigest}
+if HAS_XXHASH:
+    HASH_FUNCTIONS["xxh3"] = xxh3_128_intdigest
 
 # Tuned for false positive rate of 0.1% with 1 million elements
 DEFAULT_SIZE = 15_000_000  # ~1.8 MB
 DEFAULT_HASH_COUNT = 9
+DEFAULT_HASH = "xxh3" if "xxh3" in HASH_FUNCTIONS else "blake2b"
+
+# Serialized form is this header (size, hash_count, hash id) followed by the packed bit
+# array. N.b. the ids are part of the format, so only ever add to them.
+_HEADER = struct.Struct("<QQB")
+_HASH_IDS = {"blake2b": 0, "xxh3": 1}
+_HASH_NAMES = {hash_id: name for name, hash_id in _HASH_IDS.items()}
+
+_LOW_64_BITS = (1 << 64) - 1
 
 
 class BloomFilter:
     def __init__(
-        self, size: int = DEFAULT_SIZE, hash_count: int = DEFAULT_HASH_COUNT
+        self,
+        size: int = DEFAULT_SIZE,
+        hash_count: int = DEFAULT_HASH_COUNT,
+        hash_name: str = DEFAULT_HASH,
     ) -> None:
         """
         Initialize a Bloom filter with a given size and number of hash functions.
 
-        :param size: Size of the bit array.
+        :param size: Size of the bit array (in bits).
         :param hash_count: Number of hash functions to use.
+        :param hash_name: Name of the 128-bit hash the indices are derived from (see
+            HASH_FUNCTIONS). Filters can only be merged or shared with the same hash.
         """
+        if hash_name not in HASH_FUNCTIONS:
+            raise ValueError(f"Unsupported hash: {hash_name} (is it installed?)")
         self.size: int = size
         self.hash_count: int = hash_count
-        self.bit_array: list[int] = [0] * size
+        self.hash_name: str = hash_name
+        self._hash = HASH_FUNCTIONS[hash_name]
+        # Bits are packed eight to a byte, least significant bit first
+        self.bit_array: bytearray = bytearray((size + 7) // 8)
 
     def __str__(self) -> str:
         return f"BloomFilter(size={self.size}, hash_count={self.hash_count})"
 
     def _hashes(self, item: str) -> Generator[int, None, None]:
         """
-        Generate hash values for the given item using multiple hash functions.
+        Generate hash values for the given item using double hashing.
+
+        A single 128-bit digest is split into two 64-bit halves, and the i-th index is
+        derived as (h1 + i * h2) % size (Kirsch-Mitzenmacher).
         """
+        digest = self._hash(item.encode())
+        h1 = digest & _LOW_64_BITS
+        # N.b. h2 must be odd so the indices don't collapse when size is even
+        h2 = (digest >> 64) | 1
         for i in range(self.hash_count):
-            hash_result = int(hashlib.md5((item + str(i)).encode()).hexdigest(), 16)
-            yield hash_result % self.size
+            yield (h1 + i * h2) % self.size
 
     def add(self, item: str) -> None:
         """
@@ -43,7 +89,7 @@ class BloomFilter:
         :param item: The item to add.
         """
         for hash_value in self._hashes(item):
-            self.bit_array[hash_value] = 1
+            self.bit_array[hash_value >> 3] |= 1 << (hash_value & 7)
 
     def check(self, item: str) -> bool:
         """
@@ -52,9 +98,126 @@ class BloomFilter:
         :param item: The item to check.
         :return: True if the item is possibly in the filter, False if it is definitely not.
         """
-        return all(self.bit_array[hash_value] for hash_value in self._hashes(item))
+        return all(
+            self.bit_array[hash_value >> 3] & (1 << (hash_value & 7))
+            for hash_value in self._hashes(item)
+        )
+
+    def add_many(self, items: Iterable[str]) -> None:
+        """
+        Add several items to the Bloom filter.
+
+        Same as calling add for each item, with the hashing inlined to avoid the per-item
+        generator and method call overhead.
+
+        :param items: The items to add.
+        """
+        bit_array = self.bit_array
+        size = self.size
+        hash_range = range(self.hash_count)
+        hash_function = self._hash
+        for item in items:
+            digest = hash_function(item.encode())
+            hash_value = (digest & _LOW_64_BITS) % size
+            step = ((digest >> 64) | 1) % size
+            for _ in hash_range:
+                bit_array[hash_value >> 3] |= 1 << (hash_value & 7)
+                hash_value = (hash_value + step) % size
+
+    def check_many(self, items: Iterable[str]) -> list[bool]:
+        """
+        Check several items against the Bloom filter.
+
+        :param items: The items to check.
+        :return: A list with one result per item, in order (see check).
+        """
+        bit_array = self.bit_array
+        size = self.size
+        hash_range = range(self.hash_count)
+        hash_function = self._hash
+        results: list[bool] = []
+        for item in items:
+            digest = hash_function(item.encode())
+            hash_value = (digest & _LOW_64_BITS) % size
+            step = ((digest >> 64) | 1) % size
+            found = True
+            for _ in hash_range:
+                if not bit_array[hash_value >> 3] & (1 << (hash_value & 7)):
+                    found = False
+                    break
+                hash_value = (hash_value + step) % size
+            results.append(found)
+        return results
+
+    def merge(self, other: "BloomFilter") -> None:
+        """
+        Add all the items of another Bloom filter with the same parameters to this one.
+
+        :param other: The Bloom filter to merge in.
+        """
+        if (other.size, other.hash_count, other.hash_name) != (
+            self.size,
+            self.hash_count,
+            self.hash_name,
+        ):
+            raise ValueError(f"Cannot merge {other} into {self}")
+        merged = int.from_bytes(self.bit_array, "little") | int.from_bytes(
+            other.bit_array, "little"
+        )
+        self.bit_array[:] = merged.to_bytes(len(self.bit_array), "little")
+
+    def _header(self) -> bytes:
+        return _HEADER.pack(self.size, self.hash_count, _HASH_IDS[self.hash_name])
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the Bloom filter to bytes.
+
+        :return: The filter parameters followed by the raw bit array.
+        """
+        return self._header() + self.bit_array
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        """
+        Deserialize a Bloom filter created by to_bytes.
+
+        :param data: The serialized Bloom filter.
+        :return: The Bloom filter.
+        """
+        size, hash_count, hash_id = _HEADER.unpack_from(data)
+        if hash_id not in _HASH_NAMES:
+            raise ValueError(f"Unknown hash id: {hash_id}")
+        bloom_filter = cls(size, hash_count, _HASH_NAMES[hash_id])
+        bit_array = memoryview(data)[_HEADER.size :]
+        if len(bit_array) != len(bloom_filter.bit_array):
+            raise ValueError(
+                f"Expected {len(bloom_filter.bit_array)} bytes of bit array, got {len(bit_array)}"
+            )
+        bloom_filter.bit_array[:] = bit_array
+        return bloom_filter
+
+    def dump(self, fp: IO[bytes]) -> None:
+        """
+        Write the serialized Bloom filter to a binary file object.
+
+        :param fp: The file object to write to.
+        """
+        fp.write(self._header())
+        fp.write(self.bit_array)
+
+    @classmethod
+    def load(cls, fp: IO[bytes]) -> "BloomFilter":
+        """
+        Read a Bloom filter written by dump from a binary file object.
+
+        :param fp: The file object to read from.
+        :return: The Bloom filter.
+        """
+        return cls.from_bytes(fp.read())
 
     @staticmethod
+    @functools.lru_cache(maxsize=128)
     def optimal_parameters(n: int, p: float) -> tuple[int, int]:
         """
         Calculate optimal size and hash count for a given number of elements (n) and false positive
@@ -64,6 +227,23 @@ class BloomFilter:
         :param p: Desired false positive probability.
         :return: A tuple containing the optimal size of the bit array and the number of hash functions.
         """
-        m = -(n * math.log(p)) / (math.log(2) ** 2)
-        k = (m / n) * math.log(2)
-        return int(m), int(k)
+        if n <= 0:
+            raise ValueError(f"Number of elements must be positive: {n}")
+        if not 0 < p < 1:
+            raise ValueError(f"False positive probability must be between 0 and 1: {p}")
+        m = math.ceil(-(n * math.log(p)) / (math.log(2) ** 2))
+        k = max(1, round((m / n) * math.log(2)))
+        return m, k
+
+    @classmethod
+    def with_capacity(cls, n: int, p: float) -> "BloomFilter":
+        """
+        Create a Bloom filter sized for a given number of elements (n) and false positive
+        probability (p). See optimal_parameters.
+
+        :param n: Number of elements expected to be added to the filter.
+        :param p: Desired false positive probability.
+        :return: The Bloom filter.
+        """
+        size, hash_count = cls.optimal_parameters(n, p)
+        return cls(size, hash_count)
@@ -3,36 +3,60 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
-import json
+import itertools
 import logging
 import re
+import struct
 import time
-from collections.abc import Generator
+from collections.abc import Generator, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime
 from enum import Enum
-from urllib.parse import urlparse
+from typing import Any, cast
+from urllib.parse import urlsplit
 
+from avro.schema import RecordSchema
 from avrokit import (
     URL,
-    avro_reader,
     avro_schema,
-    avro_writer,
     create_url_mapping,
     parse_url,
 )
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchWindowException,
+)
 from seleniumbase import SB
 
-from rubbernecker.base import AVRO_CODEC
-from rubbernecker.crawl.bloomfilter import BloomFilter
+from rubbernecker.base import (
+    AVRO_CODEC,
+    BatchedAvroWriter,
+    available_cpus,
+    avro_projected_reader,
+    batched_avro_writer,
+)
+from rubbernecker.crawl.bloomfilter import (
+    DEFAULT_HASH,
+    DEFAULT_HASH_COUNT,
+    DEFAULT_SIZE,
+    BloomFilter,
+)
 
 from .actions import (
     CrawlActionName,
     CrawlActionPlan,
+    CrawlActionPlanSet,
     crawl_action,
     parse_crawl_action_plans,
 )
 
+try:
+    # orjson is optional, but parses JSONL input several times faster
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
 SCHEMA = avro_schema(
@@ -44,6 +68,8 @@ SCHEMA = avro_schema(
             {"name": "timestamp", "type": "long"},
             {"name": "body", "type": ["null", "string"], "default": None},
             {"name": "error", "type": ["null", "string"], "default": None},
+            # Precomputed bloom_filter_key of the url, so it needn't be parsed again
+            {"name": "bloom_key", "type": ["null", "string"], "default": None},
             # TODO Support passing metadata from the request
             {
                 "name": "metadata",
@@ -73,6 +99,44 @@ DEFAULT_SLEEP_ERROR: int = 10
 DEFAULT_MAX_DEPTH: int = 0
 DEFAULT_MAX_RETRIES: int = 0
 DEFAULT_REPORT_INTERVAL: int = 100
+BLOOM_FILTER_BATCH_SIZE: int = 10_000
+DEFAULT_BLOOM_FILTER_ERROR_RATE: float = 0.001
+
+# The Bloom filter is saved next to the output (e.g. output.avro.bloom), prefixed with the
+# total size of the output it was built from so a stale file can be detected
+BLOOM_FILTER_SUFFIX: str = ".bloom"
+_BLOOM_FILTER_HEADER = struct.Struct("<Q")
+
+
+# Matches the netloc, path and query of (lowercase) absolute URLs in one pass. Anything
+# urlsplit would treat differently (stray whitespace, no netloc, ...) doesn't match and
+# falls back to urlsplit.
+_BLOOM_FILTER_KEY_URL = re.compile(
+    r"^[a-z][a-z0-9+.-]*://([^/?#\s]+)([^?#\s]*)(?:\?([^#\s]*))?(?:#.*)?$"
+)
+
+
+def _scan_bloom_filter_shard(
+    url: str, size: int, hash_count: int, hash_name: str
+) -> tuple[BloomFilter, int]:
+    # Runs in a worker process of CrawlTool.load_bloom_filter
+    bloom_filter = BloomFilter(size, hash_count, hash_name)
+    count = CrawlTool().scan_output(parse_url(url), bloom_filter)
+    return bloom_filter, count
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return number
+
+
+def _error_rate(value: str) -> float:
+    rate = float(value)
+    if not 0 < rate < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1: {value}")
+    return rate
 
 
 @dataclass
@@ -93,9 +157,63 @@ class CrawlTool:
         :param url: The URL to generate a key for.
         :return: The generated key.
         """
-        parsed_url = urlparse(url.lower())
+        url = url.lower()
+        m = _BLOOM_FILTER_KEY_URL.match(url)
+        if m:
+            return f"{m[1]}:{m[2]}:{m[3] or ''}"
+        parsed_url = urlsplit(url)
         return f"{parsed_url.netloc}:{parsed_url.path}:{parsed_url.query}"
 
+    def bloom_filter_keys(self, urls: Iterable[str]) -> list[str]:
+        """
+        Generate Bloom filter keys for several URLs, same as bloom_filter_key.
+
+        :param urls: The URLs to generate keys for.
+        :return: The generated keys, in order.
+        """
+        match = _BLOOM_FILTER_KEY_URL.match
+        keys: list[str] = []
+        for url in urls:
+            m = match(url.lower())
+            keys.append(
+                f"{m[1]}:{m[2]}:{m[3] or ''}" if m else self.bloom_filter_key(url)
+            )
+        return keys
+
+    def get_page_source(self, sb, max_body_bytes: int | None = None) -> str:
+        """
+        Get the HTML of the current page, truncated to at most max_body_bytes.
+
+        With a limit, the HTML is cut down inside the browser so that huge pages are not
+        copied over the WebDriver channel in full.
+
+        :param sb: The SeleniumBase instance.
+        :param max_body_bytes: Optional maximum size of the HTML in UTF-8 bytes.
+        :return: The page HTML.
+        """
+        if max_body_bytes is None:
+            return sb.get_page_source()
+        # The page is serialized the same way as sb.get_page_source() in CDP mode. N.b.
+        # JavaScript lengths count UTF-16 code units, each of which is at least one byte.
+        expression = (
+            "(() => { const html = document.documentElement.outerHTML;"
+            f" return [html.length, html.slice(0, {max_body_bytes})]; }})()"
+        )
+        result = sb.driver.execute_cdp_cmd(
+            "Runtime.evaluate", {"expression": expression, "returnByValue": True}
+        )
+        length, body = result["result"]["value"]
+        # The slice may end in half of a surrogate pair, which is dropped when decoding
+        encoded = body.encode("utf-8", errors="surrogatepass")
+        if length > max_body_bytes or len(encoded) > max_body_bytes:
+            logger.warning(
+                "Truncating page source of %s to %d bytes",
+                sb.get_current_url(),
+                max_body_bytes,
+            )
+            body = encoded[:max_body_bytes].decode("utf-8", errors="ignore")
+        return body
+
     def is_driver_alive(self, driver) -> bool:
         """
         Check if the Selenium driver is still alive.
@@ -109,6 +227,24 @@ class CrawlTool:
         except Exception:
             return False
 
+    def is_browser_dead(self, driver, error: Exception) -> bool:
+        """
+        Decide whether a crawl error means the browser has died.
+
+        Session and window errors are conclusive on their own. Any other error falls
+        back to probing the driver, as a dead browser also surfaces as e.g. a refused
+        connection or a plain exception from CDP mode.
+
+        :param driver: The Selenium WebDriver instance.
+        :param error: The exception raised while crawling.
+        :return: True if the browser should be restarted, False otherwise.
+        """
+        if driver is None:
+            return True
+        if isinstance(error, (InvalidSessionIdException, NoSuchWindowException)):
+            return True
+        return not self.is_driver_alive(driver)
+
     def restart_browser(self, sb, headless: bool, proxy_server: str | None = None):
         """
         Restart the Selenium browser.
@@ -127,23 +263,164 @@ class CrawlTool:
             locale="en-US",
         )
 
-    def load_bloom_filter(self, output_url: URL) -> BloomFilter | None:
+    def bloom_filter_url(self, output_url: URL) -> URL | None:
+        """
+        Get the URL of the saved Bloom filter for the output URL.
+
+        :param output_url: URL to the output file.
+        :return: The Bloom filter URL, or None if the output URL is a glob.
+        """
+        if any(c in output_url.url for c in "*?["):
+            return None
+        return parse_url(output_url.url.rstrip("/") + BLOOM_FILTER_SUFFIX)
+
+    def _output_size(self, output_url: URL) -> int:
+        if not output_url.exists():
+            return 0
+        return sum(url.size() for url in output_url.expand())
+
+    def save_bloom_filter(self, bloom_filter: BloomFilter, output_url: URL) -> None:
+        """
+        Save a Bloom filter next to the output URL so it can be loaded without a scan.
+
+        N.b. the output must be fully written (i.e. its writers closed) first.
+
+        :param bloom_filter: The Bloom filter to save.
+        :param output_url: URL to the output file.
+        """
+        bloom_filter_url = self.bloom_filter_url(output_url)
+        if bloom_filter_url is None:
+            return
+        header = _BLOOM_FILTER_HEADER.pack(self._output_size(output_url))
+        with bloom_filter_url.with_mode("wb") as f:
+            f.write(header)
+            bloom_filter.dump(f)
+        logger.debug("Saved Bloom filter to %s", bloom_filter_url)
+
+    def _load_saved_bloom_filter(
+        self, output_url: URL, parameters: tuple[int, int]
+    ) -> BloomFilter | None:
+        bloom_filter_url = self.bloom_filter_url(output_url)
+        if bloom_filter_url is None or not bloom_filter_url.exists():
+            return None
+        with bloom_filter_url.with_mode("rb") as f:
+            data = f.read()
+        (output_size,) = _BLOOM_FILTER_HEADER.unpack_from(data)
+        if output_size != self._output_size(output_url):
+            logger.info("Saved Bloom filter %s is stale, rebuilding", bloom_filter_url)
+            return None
+        bloom_filter = BloomFilter.from_bytes(data[_BLOOM_FILTER_HEADER.size :])
+        if bloom_filter.hash_name != DEFAULT_HASH:
+            logger.info(
+                "Saved Bloom filter %s uses the %s hash, rebuilding",
+                bloom_filter_url,
+                bloom_filter.hash_name,
+            )
+            return None
+        if (bloom_filter.size, bloom_filter.hash_count) != parameters:
+            logger.info(
+                "Saved Bloom filter %s was sized for a different capacity, rebuilding",
+                bloom_filter_url,
+            )
+            return None
+        logger.debug("Loaded saved Bloom filter from %s", bloom_filter_url)
+        return bloom_filter
+
+    @contextmanager
+    def _saving_bloom_filter(
+        self, bloom_filter: BloomFilter | None, output_url: URL
+    ) -> Generator[None, None, None]:
+        try:
+            yield
+        finally:
+            if bloom_filter is not None:
+                try:
+                    self.save_bloom_filter(bloom_filter, output_url)
+                except Exception as e:
+                    logger.warning("Failed to save Bloom filter: %s", e)
+
+    def bloom_filter_parameters(
+        self,
+        capacity: int | None = None,
+        error_rate: float = DEFAULT_BLOOM_FILTER_ERROR_RATE,
+    ) -> tuple[int, int]:
+        """
+        Get the size and hash count of the Bloom filter for a capacity and error rate.
+
+        :param capacity: Expected number of URLs (output plus new requests), or None for
+            the default size.
+        :param error_rate: Desired false positive rate when a capacity is given.
+        :return: A tuple of the size of the bit array and the number of hash functions.
+        """
+        if capacity is None:
+            return DEFAULT_SIZE, DEFAULT_HASH_COUNT
+        return BloomFilter.optimal_parameters(capacity, error_rate)
+
+    def create_bloom_filter(
+        self,
+        capacity: int | None = None,
+        error_rate: float = DEFAULT_BLOOM_FILTER_ERROR_RATE,
+    ) -> BloomFilter:
+        """
+        Create an empty Bloom filter.
+
+        :param capacity: Expected number of URLs (output plus new requests), or None for
+            the default size.
+        :param error_rate: Desired false positive rate when a capacity is given.
+        :return: The Bloom filter.
+        """
+        return BloomFilter(*self.bloom_filter_parameters(capacity, error_rate))
+
+    def load_bloom_filter(
+        self,
+        output_url: URL,
+        capacity: int | None = None,
+        error_rate: float = DEFAULT_BLOOM_FILTER_ERROR_RATE,
+    ) -> BloomFilter | None:
         """
         Load a Bloom filter from the output URL.
 
+        A Bloom filter saved by a previous crawl is used if it is up to date with the
+        output and has the size implied by the capacity and error rate, otherwise the
+        output is scanned.
+
         :param output_url: URL to the output file.
+        :param capacity: Expected number of URLs when building a new filter (see
+            create_bloom_filter).
+        :param error_rate: Desired false positive rate when building a new filter.
         :return: A Bloom filter containing the URLs from the output file.
         """
+        try:
+            bloom_filter = self._load_saved_bloom_filter(
+                output_url, self.bloom_filter_parameters(capacity, error_rate)
+            )
+            if bloom_filter is not None:
+                return bloom_filter
+        except Exception as e:
+            logger.warning("Failed to load saved Bloom filter: %s", e)
         if output_url.exists():
-            count = 0
-            bloom_filter = BloomFilter()
-            for url in output_url.expand():
-                with avro_reader(url.with_mode("rb")) as reader:
-                    for record in reader:
-                        if isinstance(record, dict) and "url" in record:
-                            if record.get("error") is None:
-                                bloom_filter.add(self.bloom_filter_key(record["url"]))
-                                count += 1
+            bloom_filter = self.create_bloom_filter(capacity, error_rate)
+            shards = [url.url for url in output_url.expand()]
+            if len(shards) > 1:
+                # Decoding Avro is CPU-bound, so scan the shards in separate processes
+                # into filters of the same shape, then merge them
+                count = 0
+                with ProcessPoolExecutor(
+                    max_workers=min(len(shards), available_cpus())
+                ) as executor:
+                    for shard_filter, shard_count in executor.map(
+                        _scan_bloom_filter_shard,
+                        shards,
+                        itertools.repeat(bloom_filter.size),
+                        itertools.repeat(bloom_filter.hash_count),
+                        itertools.repeat(bloom_filter.hash_name),
+                    ):
+                        bloom_filter.merge(shard_filter)
+                        count += shard_count
+            else:
+                count = sum(
+                    self.scan_output(parse_url(url), bloom_filter) for url in shards
+                )
             if count > 0:
                 logger.debug(
                     "Loaded %d URLs into Bloom filter from %s", count, output_url
@@ -151,6 +428,65 @@ class CrawlTool:
                 return bloom_filter
         return None
 
+    def scan_output(self, url: URL, bloom_filter: BloomFilter) -> int:
+        """
+        Add the URLs of the successful requests in an output file to a Bloom filter.
+
+        :param url: URL to a single output file.
+        :param bloom_filter: The Bloom filter to add to.
+        :return: The number of URLs added.
+        """
+        count = 0
+        # Skip over page bodies instead of decoding them
+        with avro_projected_reader(
+            url.with_mode("rb"), ["url", "error", "bloom_key"]
+        ) as reader:
+            keys: list[str] = []
+            for record in reader:
+                if isinstance(record, dict) and "url" in record:
+                    r = cast(dict[str, Any], record)
+                    if r.get("error") is None:
+                        keys.append(
+                            r.get("bloom_key") or self.bloom_filter_key(r["url"])
+                        )
+                        count += 1
+                        if len(keys) >= BLOOM_FILTER_BATCH_SIZE:
+                            bloom_filter.add_many(keys)
+                            keys.clear()
+            bloom_filter.add_many(keys)
+        return count
+
+    def _read_requests(
+        self, input_url: URL, input_format: InputFormat
+    ) -> Generator[tuple[str, str | None], None, None]:
+        """
+        Read requests from the input URL.
+
+        :param input_url: URL to the input file.
+        :param input_format: Format of the input file (text, JSON, or Avro).
+        :return: A generator yielding each URL with its precomputed Bloom filter key, if any.
+        """
+        if input_format == InputFormat.TEXT:
+            # Input is a text file with one URL per line
+            with input_url.with_mode("r") as file:
+                for line in file:
+                    yield line.strip(), None
+        elif input_format == InputFormat.JSON:
+            # Input is a JSONL file with one URL per line (both parsers accept bytes)
+            with input_url.with_mode("rb") as file:
+                for line in file:
+                    data = cast(dict[str, Any], json_loads(line))
+                    yield data["url"], data.get("bloom_key")
+        elif input_format == InputFormat.AVRO:
+            # Input is an Avro file (only the url and bloom_key fields are decoded)
+            with avro_projected_reader(
+                input_url.with_mode("rb"), ["url", "bloom_key"]
+            ) as reader:
+                for record in reader:
+                    if isinstance(record, dict) and "url" in record:
+                        r = cast(dict[str, Any], record)
+                        yield r["url"], r.get("bloom_key")
+
     def load_requests(
         self,
         input_url: URL,
@@ -160,6 +496,12 @@ class CrawlTool:
         """
         Load requests from the input URL based on the specified format.
 
+        With a Bloom filter, URLs that occur more than once in the input (by Bloom filter
+        key) are also only loaded the first time.
+
+        N.b. with a Bloom filter, URLs are read and checked in batches, so URLs added to
+        the filter while iterating only affect later batches.
+
         :param input_url: URL to the input file.
         :param input_format: Format of the input file (text, JSON, or Avro).
         :param bloom_filter: Optional Bloom filter to check for already performed requests.
@@ -171,41 +513,91 @@ class CrawlTool:
             input_format,
             bloom_filter,
         )
-        if input_format == InputFormat.TEXT:
-            # Input is a text file with one URL per line
-            with input_url.with_mode("r") as file:
-                for line in file:
-                    url = line.strip()
-                    if isinstance(url, bytes):
-                        url = url.decode("utf-8")
-                    if not bloom_filter or not bloom_filter.check(
-                        self.bloom_filter_key(url)
-                    ):
-                        yield url
-        elif input_format == InputFormat.JSON:
-            # Input is a JSONL file with one URL per line
-            with input_url.with_mode("r") as file:
-                for line in file:
-                    data = json.loads(line)
-                    url = data["url"]
-                    if isinstance(url, bytes):
-                        url = url.decode("utf-8")
-                    if not bloom_filter or not bloom_filter.check(
-                        self.bloom_filter_key(url)
-                    ):
-                        yield url
-        elif input_format == InputFormat.AVRO:
-            # Input is an Avro file
-            with avro_reader(input_url.with_mode("rb")) as reader:
-                for record in reader:
-                    if isinstance(record, dict) and "url" in record:
-                        url = record["url"]
-                        if isinstance(url, bytes):
-                            url = url.decode("utf-8")
-                        if not bloom_filter or not bloom_filter.check(
-                            self.bloom_filter_key(url)
-                        ):
-                            yield url
+        requests = self._read_requests(input_url, input_format)
+        if not bloom_filter:
+            for url, _ in requests:
+                yield url
+            return
+        # Exact keys of the URLs loaded so far. N.b. these can't go in the Bloom filter
+        # itself, as it must only contain URLs that were actually crawled.
+        loaded: set[str] = set()
+        while batch := list(itertools.islice(requests, BLOOM_FILTER_BATCH_SIZE)):
+            # Keys are only computed for the requests that don't carry one
+            computed = iter(
+                self.bloom_filter_keys(url for url, key in batch if not key)
+            )
+            keys: list[str] = [key or next(computed) for _, key in batch]
+            seen = bloom_filter.check_many(keys)
+            for (url, _), key, url_seen in zip(batch, keys, seen):
+                if not url_seen and key not in loaded:
+                    loaded.add(key)
+                    yield url
+
+    def _navigate(self, sb, url: str, first_request: bool) -> None:
+        """
+        Navigate the browser to a URL.
+
+        :param sb: The SeleniumBase instance.
+        :param url: The URL to navigate to.
+        :param first_request: Whether this is the first request since the browser started.
+        """
+        if first_request:
+            sb.activate_cdp_mode(url)
+        elif sb.driver is None:
+            raise Exception("SeleniumBase driver is not initialized")
+        else:
+            sb.driver.execute_cdp_cmd("Page.navigate", {"url": url})
+
+    def _run_load_plans(self, sb, url: str, load_plans: CrawlActionPlanSet) -> None:
+        """
+        Run the load actions matching a URL, stopping at the first one that fails.
+
+        :param sb: The SeleniumBase instance.
+        :param url: The URL that was loaded.
+        :param load_plans: The load action plans.
+        """
+        for plan in load_plans.matching(url):
+            if not plan.run(sb.driver):
+                logger.error("Load actions failed for URL: %s", url)
+                break
+
+    def _capture(self, sb, max_body_bytes: int | None = None) -> tuple[str, str]:
+        """
+        Capture the URL and HTML of the current page.
+
+        :param sb: The SeleniumBase instance.
+        :param max_body_bytes: Optional maximum size of the HTML in UTF-8 bytes.
+        :return: The current URL and the page HTML.
+        """
+        current_url = sb.get_current_url()
+        if isinstance(current_url, bytes):
+            current_url = current_url.decode("utf-8")
+        return current_url, self.get_page_source(sb, max_body_bytes)
+
+    def _record_error(
+        self,
+        writer: BatchedAvroWriter,
+        stats: CrawlToolStats,
+        url: str,
+        timestamp: int,
+        error: Exception,
+        max_errors: int | None = None,
+    ) -> None:
+        """
+        Log a crawl error and save it to the output.
+
+        :param writer: The output writer.
+        :param stats: The crawl stats.
+        :param url: The URL that failed.
+        :param timestamp: The crawl timestamp.
+        :param error: The error raised.
+        :param max_errors: Optional maximum number of errors before giving up.
+        """
+        logger.error("Error crawling URL %s: %s", url, error)
+        writer.append({"url": url, "timestamp": timestamp, "error": str(error)})
+        stats.count_error += 1
+        if max_errors and stats.count_error >= max_errors:
+            raise Exception(f"Max errors reached: {max_errors}")
 
     def crawl(
         self,
@@ -224,35 +616,59 @@ class CrawlTool:
         use_bloom_filter: bool = False,
         max_errors: int | None = None,
         proxy_server: str | None = None,
+        bloom_filter_capacity: int | None = None,
+        bloom_filter_error_rate: float = DEFAULT_BLOOM_FILTER_ERROR_RATE,
+        max_body_bytes: int | None = None,
     ) -> CrawlToolStats:
         # Load the Bloom filter if needed
         bloom_filter: BloomFilter | None = None
         if use_bloom_filter:
             try:
-                bloom_filter = self.load_bloom_filter(base_output_url)
+                bloom_filter = self.load_bloom_filter(
+                    base_output_url,
+                    capacity=bloom_filter_capacity,
+                    error_rate=bloom_filter_error_rate,
+                )
                 logger.debug("Loaded Bloom filter: %s", bloom_filter)
             except Exception as e:
                 logger.warning("Failed to load Bloom filter: %s", e)
+            # Crawled URLs are added as we go, and the filter is saved when done
+            if bloom_filter is None:
+                bloom_filter = self.create_bloom_filter(
+                    bloom_filter_capacity, bloom_filter_error_rate
+                )
+
+        load_plans = CrawlActionPlanSet(load_actions) if load_actions else None
 
         stats = CrawlToolStats()
         first_request = True
 
-        with SB(
-            uc=True,
-            test=True,
-            incognito=True,
-            headless=headless,
-            proxy=proxy_server,
-            locale="en-US",
-        ) as sb:
+        with (
+            self._saving_bloom_filter(bloom_filter, base_output_url),
+            SB(
+                uc=True,
+                test=True,
+                incognito=True,
+                headless=headless,
+                proxy=proxy_server,
+                locale="en-US",
+            ) as sb,
+        ):
             # Iterate over the input and output URLs
             for input_url, output_url in create_url_mapping(
                 base_input_url, base_output_url
             ):
                 logger.info("Mapping %s to %s", input_url, output_url)
-                with avro_writer(
+                with batched_avro_writer(
                     output_url.with_mode("a+b"), SCHEMA, codec=AVRO_CODEC
                 ) as writer:
+                    # N.b. files created before bloom_key was added can't store it
+                    writers_schema = writer.writer.datum_writer.writers_schema
+                    store_bloom_key = (
+                        isinstance(writers_schema, RecordSchema)
+                        and "bloom_key" in writers_schema.fields_dict
+                    )
+
                     # Execute requests
                     for url in self.load_requests(
                         input_url, input_format, bloom_filter=bloom_filter
@@ -266,58 +682,28 @@ class CrawlTool:
 
                         # Mark the timestamp and depth
                         stats.count_input += 1
-                        timestamp = int(datetime.now().timestamp())  # seconds
+                        timestamp = int(time.time())  # seconds
                         depth = 0
                         retries = 0
                         crawling = False
 
                         while True:
+                            logger.info(
+                                "Crawling URL: %s (depth=%d, retries=%s)",
+                                url,
+                                depth,
+                                retries,
+                            )
                             try:
-                                # Check if browser is still alive
-                                if not self.is_driver_alive(sb.driver):
-                                    logger.warning(
-                                        "Browser died, restarting for URL: %s", url
-                                    )
-                                    first_request = True
-                                    self.restart_browser(sb, headless, proxy_server)
-
-                                logger.info(
-                                    "Crawling URL: %s (depth=%d, retries=%s)",
-                                    url,
-                                    depth,
-                                    retries,
-                                )
-
-                                # Navigate to the URL
                                 if not crawling:
-                                    if first_request:
-                                        sb.activate_cdp_mode(url)
-                                        first_request = False
-                                    elif sb.driver is None:
-                                        raise Exception(
-                                            "SeleniumBase driver is not initialized"
-                                        )
-                                    else:
-                                        sb.driver.execute_cdp_cmd(
-                                            "Page.navigate", {"url": url}
-                                        )
+                                    self._navigate(sb, url, first_request)
+                                    first_request = False
 
                                 # Wait for page to be fully loaded before capturing
                                 sb.wait_for_ready_state_complete()
+                                if load_plans:
+                                    self._run_load_plans(sb, url, load_plans)
 
-                                # Perform load actions if provided
-                                if load_actions:
-                                    for plan in load_actions:
-                                        if plan.should_run(url):
-                                            plan_result = plan.run(sb.driver)
-                                            if not plan_result:
-                                                logger.error(
-                                                    "Load actions failed for URL: %s",
-                                                    url,
-                                                )
-                                                break
-
-                                # Wait for the page to load
                                 if interactive:
                                     # Pause if in interactive mode
                                     user_input = input(
@@ -331,17 +717,21 @@ class CrawlTool:
                                     time.sleep(sleep_success)
 
                                 # Save the crawled data to the output URL
-                                current_url = sb.get_current_url()
-                                if isinstance(current_url, bytes):
-                                    current_url = current_url.decode("utf-8")
-                                writer.append(
-                                    {
-                                        "url": current_url,
-                                        "timestamp": timestamp,
-                                        "body": sb.get_page_source(),
-                                    }
-                                )
+                                current_url, body = self._capture(sb, max_body_bytes)
+                                record: dict[str, Any] = {
+                                    "url": current_url,
+                                    "timestamp": timestamp,
+                                    "body": body,
+                                }
+                                bloom_key = None
+                                if bloom_filter is not None or store_bloom_key:
+                                    bloom_key = self.bloom_filter_key(current_url)
+                                if store_bloom_key:
+                                    record["bloom_key"] = bloom_key
+                                writer.append(record)
                                 stats.count_output += 1
+                                if bloom_filter is not None and bloom_key is not None:
+                                    bloom_filter.add(bloom_key)
 
                                 # Check the current depth
                                 if depth >= max_depth:
@@ -354,20 +744,18 @@ class CrawlTool:
                                 # Run the crawl script to see if we should continue
                                 # N.b. the action will be run and we'll expect the page to navigate to
                                 # whatever is next. If the action returns False, we should stop the crawl
-                                # and continue to the next URL. We should also limit the maximum depth of
-                                # the crawl.
-                                if crawl_actions and crawl_actions.should_run(url):
-                                    # Set the crawling flag to True so we don't reload the page
-                                    crawling = True
-                                    if not crawl_actions.run(sb.driver):
-                                        logger.debug("Crawl finished for URL: %s", url)
-                                        break
-                                else:
-                                    # No crawl actions provided, just break
+                                # and continue to the next URL.
+                                if not crawl_actions or not crawl_actions.should_run(
+                                    url
+                                ):
+                                    break
+                                # Set the crawling flag to True so we don't reload the page
+                                crawling = True
+                                if not crawl_actions.run(sb.driver):
+                                    logger.debug("Crawl finished for URL: %s", url)
                                     break
                             except Exception as e:
-                                # Check if browser died
-                                if not self.is_driver_alive(sb.driver):
+                                if self.is_browser_dead(sb.driver, e):
                                     logger.warning(
                                         "Browser died during crawl, restarting: %s", e
                                     )
@@ -376,31 +764,19 @@ class CrawlTool:
                                     # Retry the same URL
                                     continue
 
-                                # Sleep on error if not in interactive mode
+                                self._record_error(
+                                    writer, stats, url, timestamp, e, max_errors
+                                )
                                 if not interactive:
                                     time.sleep(sleep_error)
 
-                                # Log the error and save it to the output URL
-                                logger.error("Error crawling URL %s: %s", url, e)
-                                writer.append(
-                                    {
-                                        "url": url,
-                                        "timestamp": timestamp,
-                                        "error": str(e),
-                                    }
-                                )
-                                stats.count_error += 1
-
-                                # Check if we should exit due to errors
-                                if max_errors and stats.count_error >= max_errors:
-                                    raise Exception(f"Max errors reached: {max_errors}")
-
                                 # Check if we should retry
                                 if retries >= max_retries:
                                     logger.debug(
                                         "Maximum retries reached for URL: %s", url
                                     )
                                     break
+                                retries += 1
         return stats
 
     def configure(self, subparsers: argparse._SubParsersAction) -> None:
@@ -478,6 +854,24 @@ class CrawlTool:
             action="store_true",
             help="Use a Bloom filter on output file to avoid duplicate requests",
         )
+        parser.add_argument(
+            "--bloom_filter_capacity",
+            type=_positive_int,
+            default=None,
+            help="Expected number of URLs (existing output plus new requests) to size the Bloom filter for (default: ~1M)",
+        )
+        parser.add_argument(
+            "--bloom_filter_error_rate",
+            type=_error_rate,
+            default=DEFAULT_BLOOM_FILTER_ERROR_RATE,
+            help=f"Bloom filter false positive rate when --bloom_filter_capacity is set (default: {DEFAULT_BLOOM_FILTER_ERROR_RATE})",
+        )
+        parser.add_argument(
+            "--max_body_bytes",
+            type=int,
+            default=None,
+            help="Truncate page HTML longer than this many bytes (default: no limit)",
+        )
         parser.add_argument(
             "--max_errors",
             type=int,
@@ -546,5 +940,8 @@ class CrawlTool:
             use_bloom_filter=args.use_bloom_filter,
             max_errors=args.max_errors,
             proxy_server=args.proxy_server,
+            bloom_filter_capacity=args.bloom_filter_capacity,
+            bloom_filter_error_rate=args.bloom_filter_error_rate,
+            max_body_bytes=args.max_body_bytes,
         )
         logger.info("%s (done)", stats)
@@ -4,17 +4,36 @@
 
 import argparse
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from dataclasses import dataclass
 from urllib.parse import urlparse
 
 import requests
 from avrokit import URL, parse_url
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from rubbernecker.crawl.bloomfilter import BloomFilter
 
 logger = logging.getLogger("fetchtool")
 
+# Number of fetches queued per worker while streaming the input
+MAX_INFLIGHT_PER_WORKER = 4
+
+# Responses are streamed to the output in chunks of this size instead of being read whole
+FETCH_CHUNK_SIZE = 1 << 16
+
+# Retries for connection errors and transient server responses
+MAX_RETRIES = 2
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
 
 @dataclass
 class FetchToolStats:
@@ -50,6 +69,27 @@ class FetchTool:
             help="Redownload even if file already exists (default: skip existing)",
         )
 
+    def create_session(self, parallelism: int) -> requests.Session:
+        """
+        Create an HTTP session shared by all fetch workers.
+
+        :param parallelism: Number of concurrent fetches, used to size the connection pool.
+        :return: The session.
+        """
+        adapter = HTTPAdapter(
+            pool_connections=parallelism,
+            pool_maxsize=parallelism,
+            max_retries=Retry(
+                total=MAX_RETRIES,
+                backoff_factor=RETRY_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUS_CODES,
+            ),
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def load_bloom_filter(self, output_url: URL) -> BloomFilter | None:
         if output_url.exists():
             bloom_filter = BloomFilter()
@@ -77,29 +117,38 @@ class FetchTool:
         output_base_url: URL,
         force: bool,
         bloom_filter: BloomFilter | None,
+        session: requests.Session | None = None,
     ) -> tuple[bool, bool]:
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            content = response.content
-
-            parsed = urlparse(url)
-            path = parsed.path.lstrip("/")
+            get = session.get if session is not None else requests.get
+            with get(url, timeout=30, stream=True) as response:
+                response.raise_for_status()
 
-            if not path:
-                logger.warning("URL %s has no path, skipping", url)
-                return False, False
+                parsed = urlparse(url)
+                path = parsed.path.lstrip("/")
 
-            if not force and bloom_filter and bloom_filter.check(path):
-                logger.debug("File already exists (bloom filter), skipping: %s", path)
-                return True, True
+                if not path:
+                    logger.warning("URL %s has no path, skipping", url)
+                    return False, False
 
-            output_url = parse_url(output_base_url.url + "/" + path)
-            with output_url.with_mode("wb") as f:
-                f.write(content)
+                if not force and bloom_filter and bloom_filter.check(path):
+                    logger.debug(
+                        "File already exists (bloom filter), skipping: %s", path
+                    )
+                    return True, True
 
-            if bloom_filter:
-                bloom_filter.add(path)
+                output_url = parse_url(output_base_url.url + "/" + path)
+                try:
+                    with output_url.with_mode("wb") as f:
+                        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+                            f.write(chunk)
+                except Exception:
+                    # N.b. a partial file would be taken as fetched by the next run
+                    try:
+                        output_url.delete()
+                    except Exception:
+                        pass
+                    raise
 
             logger.debug("Fetched %s -> %s", url, output_url)
             return True, False
@@ -108,6 +157,33 @@ class FetchTool:
             logger.error("Error fetching %s: %s", url, e)
             return False, False
 
+    def _record_result(
+        self,
+        stats: FetchToolStats,
+        future: Future[tuple[bool, bool]],
+        url: str,
+        bloom_filter: BloomFilter | None = None,
+    ) -> None:
+        try:
+            success, skipped = future.result()
+            if success:
+                if skipped:
+                    stats.count_skipped += 1
+                else:
+                    stats.count_output += 1
+                    # N.b. adding sets bits in place, so it's only done from this thread
+                    if bloom_filter:
+                        bloom_filter.add(urlparse(url).path.lstrip("/"))
+            else:
+                stats.count_error += 1
+        except Exception as e:
+            logger.error("Error processing %s: %s", url, e)
+            stats.count_error += 1
+
+        if logging.DEBUG != logger.getEffectiveLevel():
+            if stats.count_output > 0 and stats.count_output % 100 == 0:
+                logger.info("%s", stats)
+
     def fetch(
         self, input_url: URL, output_url: URL, parallelism: int, force: bool = False
     ) -> FetchToolStats:
@@ -120,41 +196,50 @@ class FetchTool:
             except Exception as e:
                 logger.warning("Failed to load bloom filter: %s", e)
 
-        with input_url.with_mode("r") as f:
-            urls = [line.strip() for line in f if line.strip()]
-
-        logger.info("Fetching %d URLs with parallelism=%d", len(urls), parallelism)
+        logger.info("Fetching URLs from %s with parallelism=%d", input_url, parallelism)
 
         if bloom_filter:
             logger.info("Bloom filter loaded, will skip existing files")
 
-        with ThreadPoolExecutor(max_workers=parallelism) as executor:
-            futures = {
-                executor.submit(
-                    self.fetch_url, url, output_url, force, bloom_filter
-                ): url
-                for url in urls
-            }
-
-            for future in as_completed(futures):
-                url = futures[future]
+        # Stream the input and keep a bounded number of fetches in flight, rather than
+        # reading every URL and submitting every future up front
+        max_inflight = parallelism * MAX_INFLIGHT_PER_WORKER
+        inflight: dict[Future[tuple[bool, bool]], str] = {}
+
+        # Share one session across workers so connections are kept alive and reused
+        with (
+            input_url.with_mode("r") as f,
+            self.create_session(parallelism) as session,
+            ThreadPoolExecutor(max_workers=parallelism) as executor,
+        ):
+            for line in f:
+                url = line.strip()
+                if not url:
+                    continue
                 stats.count_input += 1
-                try:
-                    success, skipped = future.result()
-                    if success:
-                        if skipped:
-                            stats.count_skipped += 1
-                        else:
-                            stats.count_output += 1
-                    else:
-                        stats.count_error += 1
-                except Exception as e:
-                    logger.error("Error processing %s: %s", url, e)
-                    stats.count_error += 1
-
-                if logging.DEBUG != logger.getEffectiveLevel():
-                    if stats.count_output > 0 and stats.count_output % 100 == 0:
-                        logger.info("%s", stats)
+
+                # Skip existing files before they take up a worker
+                if bloom_filter and bloom_filter.check(urlparse(url).path.lstrip("/")):
+                    logger.debug(
+                        "File already exists (bloom filter), skipping: %s", url
+                    )
+                    stats.count_skipped += 1
+                    continue
+
+                future = executor.submit(
+                    self.fetch_url, url, output_url, force, bloom_filter, session
+                )
+                inflight[future] = url
+
+                if len(inflight) >= max_inflight:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._record_result(
+                            stats, future, inflight.pop(future), bloom_filter
+                        )
+
+            for future in as_completed(inflight):
+                self._record_result(stats, future, inflight[future], bloom_filter)
 
         return stats
 
@@ -2,18 +2,24 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import functools
 import importlib
-import inspect
 import pkgutil
-import sys
 from abc import ABC, abstractmethod
 from collections.abc import Generator
-from typing import cast
+from typing import ClassVar
 
 from avro.schema import Schema
 
 
 class Parser(ABC):
+    # Every subclass, registered as it is defined
+    _registry: ClassVar[list[type["Parser"]]] = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Parser._registry.append(cls)
+
     @abstractmethod
     def parse(self, record: object) -> Generator[object | None, None, None]: ...
 
@@ -21,29 +27,28 @@ class Parser(ABC):
     def schema(self) -> Schema: ...
 
 
-def list_parsers() -> list[type[Parser]]:
-    if not __package__:
-        raise ValueError("Module name is not set. Cannot list parsers.")
-    # Load all the modules to ensure that parser classes are registered
-    module = importlib.import_module(__package__)
-    if isinstance(module, str):
-        module = importlib.import_module(module)
-    results = {}
+@functools.cache
+def _import_parser_modules(package: str) -> None:
+    """
+    Import every module in the package (once) so that their parsers are registered.
+
+    :param package: The name of the package to import.
+    """
+    module = importlib.import_module(package)
     for _, name, _ in pkgutil.walk_packages(module.__path__, module.__name__ + "."):
         try:
-            results[name] = importlib.import_module(name)
+            importlib.import_module(name)
         except Exception:
             pass  # Ignore modules that can't be imported
-    # Find all classes that implement the Parser protocol
-    classes: list[type[Parser]] = []
-    for mod in sys.modules.values():
-        if mod and getattr(mod, "__name__", "").startswith(module.__name__):
-            for _, obj in inspect.getmembers(mod, inspect.isclass):
-                if (
-                    isinstance(obj, type)
-                    and obj.__module__.startswith(module.__name__)
-                    and issubclass(obj, Parser)
-                    and obj is not Parser
-                ):
-                    classes.append(cast(type[Parser], obj))
-    return classes
+
+
+def list_parsers() -> list[type[Parser]]:
+    if not __package__:
+        raise ValueError("Module name is not set. Cannot list parsers.")
+    _import_parser_modules(__package__)
+    # Only parsers defined in this package, not e.g. ones loaded from a script
+    return [
+        parser
+        for parser in Parser._registry
+        if parser.__module__.startswith(__package__)
+    ]
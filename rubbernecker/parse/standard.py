@@ -2,21 +2,107 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import functools
 import logging
-from collections.abc import Generator
+import re
+from collections.abc import Collection, Generator
 from typing import Any, cast
-from urllib.parse import urlparse
+from urllib.parse import urlsplit
 
 from avro.schema import Schema
 from avrokit import avro_schema
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, PageElement, Tag
 
 from .base import Parser
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    HAS_LEXBOR = False
+else:
+    HAS_LEXBOR = True
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    HAS_LXML = False
+else:
+    HAS_LXML = True
+
 logger = logging.getLogger(__name__)
 
+# Parse with selectolax's lexbor backend or with lxml itself instead of BeautifulSoup
+LEXBOR = "lexbor"
+LXML_HTML = "lxml.html"
+
+# Both lexbor and lxml parse HTML in C, many times faster than the pure Python
+# html.parser, but they're optional dependencies
+if HAS_LEXBOR:
+    DEFAULT_FEATURES = LEXBOR
+elif HAS_LXML:
+    DEFAULT_FEATURES = LXML_HTML
+else:
+    DEFAULT_FEATURES = "html.parser"
+
+if HAS_LXML:
+    # The strings BeautifulSoup's get_text() keeps (e.g. no scripts or comments)
+    _LXML_BODY_TEXT = lxml.etree.XPath(
+        "//body//text()[not(ancestor::script or ancestor::style or ancestor::template)]",
+        smart_strings=False,
+    )
+    _LXML_HEADERS = lxml.etree.XPath("//h1|//h2|//h3|//h4|//h5|//h6")
+    _LXML_LINKS = lxml.etree.XPath("//a[@href]")
+
+_HEADER_LEVELS = {f"h{level}": level for level in range(1, 7)}
+
+# Elements whose text the other backends leave out of the body text
+_LEXBOR_HIDDEN_TAGS = ["script", "style", "template"]
+_BODY_TAG = re.compile(r"<body[\s/>]", re.IGNORECASE)
+
+
+# The netloc of an absolute or scheme-relative URL, when urlsplit would find the same one
+_NETLOC = re.compile(r"^(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//([^/?#\t\r\n]*)(?=[/?#]|$)")
+
+
+def _netloc(href: str) -> str:
+    # Only absolute and scheme-relative (e.g. "//host/path") URLs have a netloc, so the
+    # common relative links are answered without parsing
+    if "//" not in href:
+        return ""
+    m = _NETLOC.match(href)
+    if m is not None:
+        return m[1]
+    return _urlsplit_netloc(href)
+
+
+@functools.lru_cache(maxsize=4096)
+def _urlsplit_netloc(href: str) -> str:
+    # E.g. URLs with surrounding whitespace, which urlsplit strips
+    return urlsplit(href).netloc
+
 
 class StandardPageParser(Parser):
+    def __init__(self, features: str = DEFAULT_FEATURES) -> None:
+        """
+        Initialize the parser with a given HTML tree builder.
+
+        :param features: "lexbor", "lxml.html", or the BeautifulSoup tree builder to use
+            (e.g. "lxml", "html.parser").
+        """
+        if features == LEXBOR and not HAS_LEXBOR:
+            raise ValueError("The lexbor parser requires selectolax to be installed")
+        if features == LXML_HTML and not HAS_LXML:
+            raise ValueError("The lxml.html parser requires lxml to be installed")
+        self.features = features
+        # Pick the backend once rather than for every record
+        if features == LEXBOR:
+            self._parse_page = self._parse_lexbor
+        elif features == LXML_HTML:
+            self._parse_page = self._parse_lxml
+        else:
+            self._parse_page = self._parse_soup
+
     def schema(self) -> Schema:
         return avro_schema(
             {
@@ -84,45 +170,129 @@ class StandardPageParser(Parser):
             }
         )
 
-    def _parse_headers(self, soup: BeautifulSoup) -> list[dict[str, Any]]:
+    def _link(self, netloc: str, text: str, href: str) -> dict[str, Any]:
+        href_netloc = _netloc(href)
+        return {
+            "text": text,
+            "url": href,
+            "external": bool(href_netloc) and (href_netloc != netloc),
+        }
+
+    def _parse_soup(self, url: str, body: str) -> dict[str, Any]:
+        soup = BeautifulSoup(body, self.features)
+        netloc = _netloc(url)
+        title: str | None = None
         headers: list[dict[str, Any]] = []
-        for header in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-            if isinstance(header, Tag):
-                level = int(header.name[1])
-                headers.append({"level": level, "text": header.get_text()})
-        return headers
-
-    def _parse_links(self, url: str, soup: BeautifulSoup) -> list[dict[str, Any]]:
-        parsed_url = urlparse(url)
         links: list[dict[str, Any]] = []
-        for link in soup.find_all("a"):
-            if isinstance(link, Tag):
-                href = link.get("href")
-                if href:
-                    parsed_href = urlparse(str(href))
-                    links.append(
-                        {
-                            "text": link.get_text(),
-                            "url": str(href),
-                            "external": bool(parsed_href.netloc)
-                            and (parsed_href.netloc != parsed_url.netloc),
-                        }
-                    )
-        return links
+
+        # Collect everything in a single walk over the document. The body's descendants
+        # are contiguous in it, ending where the element after the body starts.
+        body_tag = soup.body
+        body_end: PageElement | None = None
+        text_types: Collection[type] = ()
+        if body_tag is not None:
+            node: PageElement | None = body_tag
+            while node is not None and node.next_sibling is None:
+                node = node.parent
+            body_end = node.next_sibling if node is not None else None
+            # N.b. get_text() only keeps the body's own string types (e.g. no scripts)
+            types = body_tag.interesting_string_types or Tag.MAIN_CONTENT_STRING_TYPES
+            text_types = (types,) if isinstance(types, type) else types
+        body_text: list[str] = []
+        in_body = False
+
+        for element in soup.descendants:
+            if element is body_tag:
+                in_body = True
+            elif element is body_end:
+                in_body = False
+            if isinstance(element, Tag):
+                name = element.name
+                level = _HEADER_LEVELS.get(name)
+                if level is not None:
+                    headers.append({"level": level, "text": element.get_text()})
+                elif name == "a":
+                    href = element.get("href")
+                    if href:
+                        links.append(self._link(netloc, element.get_text(), str(href)))
+                elif name == "title" and title is None:
+                    title = element.get_text()
+            elif in_body and type(element) in text_types:
+                body_text.append(str(element))
+
+        return {
+            "title": title,
+            "body_text": "".join(body_text) if body_tag is not None else None,
+            "headers": headers,
+            "links": links,
+        }
+
+    def _parse_lexbor(self, url: str, body: str) -> dict[str, Any]:
+        tree = LexborHTMLParser(body)
+        title = tree.css_first("title")
+        netloc = _netloc(url)
+        links: list[dict[str, Any]] = []
+        for link in tree.css("a[href]"):
+            href = link.attributes.get("href")
+            if href:
+                links.append(self._link(netloc, link.text(), href))
+        headers = [
+            {"level": level, "text": header.text()}
+            for header in tree.css("h1, h2, h3, h4, h5, h6")
+            if (level := _HEADER_LEVELS.get(header.tag or "")) is not None
+        ]
+        # lexbor always creates a body, even for a document without any body content
+        body_text: str | None = None
+        if tree.body is not None and (
+            tree.body.child is not None or _BODY_TAG.search(body)
+        ):
+            # Like the other backends, leave out text that isn't displayed
+            tree.strip_tags(_LEXBOR_HIDDEN_TAGS)
+            body_text = tree.body.text()
+        return {
+            "title": title.text() if title else None,
+            "body_text": body_text,
+            "headers": headers,
+            "links": links,
+        }
+
+    def _parse_lxml(self, url: str, body: str) -> dict[str, Any]:
+        try:
+            root = lxml.html.document_fromstring(body)
+        except lxml.etree.ParserError:
+            # E.g. an empty document
+            return {"title": None, "body_text": None, "headers": [], "links": []}
+        title = root.find(".//title")
+        netloc = _netloc(url)
+        links: list[dict[str, Any]] = []
+        for link in _LXML_LINKS(root):
+            href = link.get("href")
+            if href:
+                links.append(self._link(netloc, link.text_content(), href))
+        return {
+            "title": title.text_content() if title is not None else None,
+            "body_text": "".join(_LXML_BODY_TEXT(root))
+            if root.find("body") is not None
+            else None,
+            "headers": [
+                {"level": _HEADER_LEVELS[header.tag], "text": header.text_content()}
+                for header in _LXML_HEADERS(root)
+            ],
+            "links": links,
+        }
 
     def parse(self, record: object) -> Generator[object | None, None, None]:
         if not isinstance(record, dict):
             logger.error("Record is not a dictionary: %s", record)
             return
         r = cast(dict[str, Any], record)
-        soup = BeautifulSoup(r["body"], "html.parser")
-        body_text = soup.body.get_text() if soup.body else None
+        page = self._parse_page(r["url"], r["body"])
         yield {
             "url": r["url"],
             "timestamp": r["timestamp"],
-            "title": soup.title.get_text() if soup.title else None,
+            "title": page["title"],
             "content_length": len(r["body"]) if r["body"] else 0,
-            "body_text": body_text,
-            "headers": self._parse_headers(soup),
-            "links": self._parse_links(r["url"], soup),
+            "body_text": page["body_text"],
+            "headers": page["headers"],
+            "links": page["links"],
         }
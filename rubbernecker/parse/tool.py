@@ -7,24 +7,31 @@ import importlib
 import importlib.util
 import logging
 import multiprocessing
-import os
 import sys
-import time
+import threading
+from collections.abc import Callable, Generator, Iterable
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, cast
 
-from avro.schema import Schema
-from avrokit import URL, avro_reader, avro_writer, create_url_mapping, parse_url
+from avrokit import URL, avro_reader, create_url_mapping, parse_url
 
-from rubbernecker.base import AVRO_CODEC
+from rubbernecker.base import (
+    AVRO_CODEC,
+    AVRO_MAX_BLOCK_BYTES,
+    AvroBlock,
+    available_cpus,
+    avro_block_reader,
+    batched_avro_writer,
+    decode_avro_block,
+)
 
 from .base import Parser, list_parsers
 
 logger = logging.getLogger("parsetool")
 
 
-@dataclass
+@dataclass(slots=True)
 class ParseToolStats:
     count_input: int = 0
     count_output: int = 0
@@ -37,97 +44,74 @@ class ParseToolStats:
             count_error=self.count_error + other.count_error,
         )
 
+    def __iadd__(self, other: "ParseToolStats") -> "ParseToolStats":
+        self.count_input += other.count_input
+        self.count_output += other.count_output
+        self.count_error += other.count_error
+        return self
 
-POISON_PILL = (None, None)  # Signal to workers to stop
-WRITE_DONE = (None, None, None)  # Signal that writing is complete
 
+# Input blocks are handed to workers still encoded, with a bounded number in flight
+MAX_INFLIGHT_BLOCKS_PER_WORKER = 4
 
-def worker_process(
-    parser_class: str,
-    script_path: str | None,
-    work_queue: multiprocessing.Queue,
-    result_queue: multiprocessing.Queue,
-) -> None:
-    """Worker process that parses records from work_queue and puts results on result_queue."""
-    logger.debug("Worker starting")
+# Parsed records are much smaller than pages, so more of them go in each output block.
+# Blocks of records with a lot of body text are still written out at the size limit.
+WRITE_BATCH_SIZE = 256
+WRITE_MAX_BLOCK_BYTES = AVRO_MAX_BLOCK_BYTES
+
+# The parse method of a worker process's parser, set up by _init_worker
+_parse: Callable[[object], Iterable[object | None]] | None = None
+_parser_error: Exception | None = None
+
+
+def _init_worker(parser_name: str, script_path: str | None) -> None:
+    """Initialize the parser of a worker process."""
+    global _parse, _parser_error
     try:
-        # Initialize parser in worker process
-        parser = ParseTool._load_parser_static(parser_class, script_path)
+        _parse = ParseTool._load_parser_static(parser_name, script_path).parse
         logger.debug("Worker initialized parser successfully")
     except Exception as e:
+        # N.b. raising here would make the pool restart the worker forever
         logger.error("Worker failed to initialize parser: %s", e)
-        # Signal done so writer doesn't hang
-        result_queue.put(("done", None, None, None))
-        return
-
-    while True:
-        task = work_queue.get()
-        if task == POISON_PILL:
-            # Signal to writer that this worker is done
-            result_queue.put(("done", None, None, None))
-            break
-
-        seq_id, record = task
-        stats = ParseToolStats()
-
+        _parser_error = e
+
+
+def _parse_block(block: AvroBlock) -> tuple[list[dict[str, Any]], ParseToolStats]:
+    """Decode and parse a block of input records in a worker process."""
+    if _parse is None:
+        raise RuntimeError(f"Worker failed to initialize parser: {_parser_error}")
+    stats = ParseToolStats()
+    results: list[dict[str, Any]] = []
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    for record in decode_avro_block(block):
+        stats.count_input += 1
         try:
-            stats.count_input = 1
-            results: list[dict[str, Any]] = []
-            for parsed_record in parser.parse(record):
-                if parsed_record is not None:
-                    results.append(cast(dict[str, Any], parsed_record))
-                    stats.count_output += 1
-            result_queue.put(("result", seq_id, results, stats))
+            parsed_records = [
+                cast(dict[str, Any], parsed_record)
+                for parsed_record in _parse(record)
+                if parsed_record is not None
+            ]
         except Exception as e:
             logger.error("Error parsing record: %s", e)
-            if logging.DEBUG == logger.getEffectiveLevel():
+            if debug_enabled:
                 logger.exception(e)
-            stats.count_error = 1
-            result_queue.put(("result", seq_id, None, stats))
-
-
-def writer_process(
-    output_url: URL,
-    schema: Schema,
-    result_queue: multiprocessing.Queue,
-    num_workers: int,
-    stats_accumulator: dict,
-) -> None:
-    """Writer process that consumes results and writes to Avro."""
-    logger.debug("Writer process starting, expecting %d workers", num_workers)
-    workers_done = 0
-
-    with avro_writer(output_url.with_mode("wb"), schema, codec=AVRO_CODEC) as writer:
-        while workers_done < num_workers:
-            msg_type, seq_id, results, task_stats = result_queue.get()
-
-            if msg_type == "done":
-                workers_done += 1
-                continue
-
-            # Accumulate stats
-            stats_accumulator["count_input"] += task_stats.count_input
-            stats_accumulator["count_output"] += task_stats.count_output
-            stats_accumulator["count_error"] += task_stats.count_error
-
-            # Write results
-            if results:
-                for parsed_record in results:
-                    writer.append(parsed_record)
-
-            # Progress logging every 1k records
-            total_processed = (
-                stats_accumulator["count_output"] + stats_accumulator["count_error"]
-            )
-            if total_processed % 1000 == 0:
-                logger.info(
-                    "Progress: input=%d output=%d errors=%d",
-                    stats_accumulator["count_input"],
-                    stats_accumulator["count_output"],
-                    stats_accumulator["count_error"],
-                )
+            stats.count_error += 1
+            continue
+        stats.count_output += len(parsed_records)
+        results.extend(parsed_records)
+    return results, stats
+
 
-        logger.debug("Writer process finished")
+def _bounded(
+    blocks: Iterable[AvroBlock], semaphore: threading.Semaphore, stop: threading.Event
+) -> Generator[AvroBlock, None, None]:
+    # Pool.imap_unordered consumes its input as fast as it can, so hold it back until
+    # earlier blocks have been parsed
+    for block in blocks:
+        semaphore.acquire()
+        if stop.is_set():
+            return
+        yield block
 
 
 class ParseTool:
@@ -176,14 +160,20 @@ class ParseTool:
             # Open the input URL and output URL as Avro files
             with (
                 avro_reader(input_url.with_mode("rb")) as reader,
-                avro_writer(
-                    output_url.with_mode("wb"), parser.schema(), codec=AVRO_CODEC
+                batched_avro_writer(
+                    output_url.with_mode("wb"),
+                    parser.schema(),
+                    codec=AVRO_CODEC,
+                    batch_size=WRITE_BATCH_SIZE,
+                    max_block_bytes=WRITE_MAX_BLOCK_BYTES,
                 ) as writer,
             ):
+                parse = parser.parse
+                debug_enabled = logger.isEnabledFor(logging.DEBUG)
                 for record in reader:
                     try:
                         stats.count_input += 1
-                        for parsed_record in parser.parse(record):
+                        for parsed_record in parse(record):
                             if parsed_record is None:
                                 logger.debug("Record is None, skipping")
                                 continue
@@ -191,13 +181,11 @@ class ParseTool:
                             writer.append(parsed_record)
                     except Exception as e:
                         logger.error("Error parsing record: %s", e)
-                        if logging.DEBUG == logger.getEffectiveLevel():
+                        if debug_enabled:
                             logger.exception(e)
                         stats.count_error += 1
-                    finally:
-                        if logging.DEBUG == logger.getEffectiveLevel():
-                            if stats.count_input > 0 and stats.count_input % 100 == 0:
-                                logger.debug("%s", stats)
+                    if debug_enabled and stats.count_input % 100 == 0:
+                        logger.debug("%s", stats)
         return stats
 
     def parse_parallel(
@@ -208,7 +196,11 @@ class ParseTool:
         num_workers: int,
         script_path: str | None = None,
     ) -> ParseToolStats:
-        """Parse with process-level parallelism using bounded queues."""
+        """
+        Parse with a pool of worker processes, writing results from this process.
+
+        Workers are handed whole Avro blocks of the input, which they decode themselves.
+        """
         # Get parser info for worker initialization
         parser_class = parser.__class__.__name__
         # When using a script, just use the class name (module is derived from script filename)
@@ -220,116 +212,72 @@ class ParseTool:
             worker_parser_name = f"{parser_module}.{parser_class}"
 
         stats = ParseToolStats()
-
-        for input_url, output_url in create_url_mapping(
-            base_input_url, base_output_url
-        ):
-            logger.info(
-                "Parsing (parallel=%d) %s -> %s", num_workers, input_url, output_url
-            )
-
-            # Bounded queues for backpressure (larger to prevent deadlock)
-            queue_maxsize = max(100, num_workers * 10)
-            work_queue: multiprocessing.Queue = multiprocessing.Queue(
-                maxsize=queue_maxsize
-            )
-            result_queue: multiprocessing.Queue = multiprocessing.Queue(
-                maxsize=queue_maxsize
-            )
-
-            # Shared stats accumulator
-            manager = multiprocessing.Manager()
-            shared_stats = manager.dict()
-            shared_stats["count_input"] = 0
-            shared_stats["count_output"] = 0
-            shared_stats["count_error"] = 0
-
-            # Start worker processes
-            workers: list[multiprocessing.Process] = []
-            for i in range(num_workers):
-                p = multiprocessing.Process(
-                    target=worker_process,
-                    args=(worker_parser_name, script_path, work_queue, result_queue),
-                )
-                p.start()
-                workers.append(p)
-                logger.debug("Started worker %d (pid=%d)", i, p.pid)
-
-            # Give workers a moment to initialize
-            time.sleep(0.5)
-
-            # Check if any workers died immediately
-            dead_workers = [i for i, p in enumerate(workers) if not p.is_alive()]
-            if dead_workers:
-                raise RuntimeError(
-                    f"Workers {dead_workers} died immediately after starting"
+        max_inflight = num_workers * MAX_INFLIGHT_BLOCKS_PER_WORKER
+
+        context = multiprocessing.get_context()
+        if context.get_start_method() == "forkserver":
+            # Workers are forked from the server, so import the parser's dependencies
+            # there once instead of in every worker
+            preload = [__name__]
+            if not script_path:
+                preload.append(parser.__class__.__module__)
+            context.set_forkserver_preload(preload)
+
+        with context.Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(worker_parser_name, script_path),
+        ) as pool:
+            for input_url, output_url in create_url_mapping(
+                base_input_url, base_output_url
+            ):
+                logger.info(
+                    "Parsing (parallel=%d) %s -> %s", num_workers, input_url, output_url
                 )
-
-            # Start writer process
-            writer_p = multiprocessing.Process(
-                target=writer_process,
-                args=(
-                    output_url,
-                    parser.schema(),
-                    result_queue,
-                    num_workers,
-                    shared_stats,
-                ),
-            )
-            writer_p.start()
-
-            try:
-                # Producer: read records and put on work queue (blocks when full)
-                record_count = 0
-                logger.info("Starting to read records from %s", input_url)
-                with avro_reader(input_url.with_mode("rb")) as reader:
-                    logger.info("Avro reader opened successfully")
-                    for seq_id, record in enumerate(reader):
-                        work_queue.put((seq_id, record))
-                        record_count += 1
-
-                logger.info("Finished queuing %d records", record_count)
-
-                # Signal workers to stop
-                for _ in range(num_workers):
-                    work_queue.put(POISON_PILL)
-
-                # Wait for workers to finish (no timeout - let them work)
-                logger.info("Waiting for %d workers to finish...", num_workers)
-                for i, p in enumerate(workers):
-                    p.join()
-                    logger.debug("Worker %d finished", i)
-
-                # Wait for writer to finish (no timeout)
-                logger.info("Waiting for writer to finish...")
-                writer_p.join()
-                logger.debug("Writer finished")
-
-                # Copy stats from shared dict
-                stats.count_input += shared_stats["count_input"]
-                stats.count_output += shared_stats["count_output"]
-                stats.count_error += shared_stats["count_error"]
-
-            except KeyboardInterrupt:
-                logger.warning("Interrupted! Shutting down workers...")
-
-                # Terminate workers
-                for p in workers:
-                    if p.is_alive():
-                        p.terminate()
-                        p.join(timeout=1)
-
-                if writer_p.is_alive():
-                    writer_p.terminate()
-                    writer_p.join(timeout=1)
-
-                # Clean up partial output
-                logger.warning("Discarding incomplete output for %s", output_url)
+                semaphore = threading.Semaphore(max_inflight)
+                stop = threading.Event()
+                next_progress = 1000
                 try:
-                    output_url.delete()
-                except Exception:
-                    pass
-                raise
+                    with batched_avro_writer(
+                        output_url.with_mode("wb"),
+                        parser.schema(),
+                        codec=AVRO_CODEC,
+                        batch_size=WRITE_BATCH_SIZE,
+                        max_block_bytes=WRITE_MAX_BLOCK_BYTES,
+                    ) as writer:
+                        blocks = avro_block_reader(input_url.with_mode("rb"))
+                        try:
+                            for results, task_stats in pool.imap_unordered(
+                                _parse_block, _bounded(blocks, semaphore, stop)
+                            ):
+                                semaphore.release()
+                                stats += task_stats
+                                for parsed_record in results:
+                                    writer.append(parsed_record)
+
+                                # Progress logging every 1k records
+                                if stats.count_input >= next_progress:
+                                    next_progress = (
+                                        stats.count_input // 1000 + 1
+                                    ) * 1000
+                                    logger.info(
+                                        "Progress: input=%d output=%d errors=%d",
+                                        stats.count_input,
+                                        stats.count_output,
+                                        stats.count_error,
+                                    )
+                        finally:
+                            # Unblock the pool's feeder thread if we stopped early
+                            stop.set()
+                            semaphore.release()
+                except KeyboardInterrupt:
+                    # N.b. leaving the pool's context terminates the workers
+                    logger.warning("Discarding incomplete output for %s", output_url)
+                    try:
+                        output_url.delete()
+                    except Exception:
+                        pass
+                    raise
 
         return stats
 
@@ -353,8 +301,7 @@ class ParseTool:
         )
 
         # Calculate default parallelism
-        cpu_count = os.cpu_count()
-        default_parallelism = max(1, (cpu_count // 2) if cpu_count else 1)
+        default_parallelism = max(1, available_cpus() // 2)
 
         parser.add_argument(
             "--parallelism",
@@ -18,37 +18,15 @@ from avrokit import avro_schema, avro_writer, parse_url
 
 from rubbernecker.base import AVRO_CODEC
 
+# Reuse the same Page schema as crawl/fetch so --save-sitemaps output is
+# compatible with downstream tools (parse, etc.).
+from rubbernecker.crawl.tool import SCHEMA as PAGE_SCHEMA
+
 logger = logging.getLogger(__name__)
 
 # Namespace used in standard sitemap XML
 _SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
 
-# Reuse the same Page schema as crawl/fetch so --save-sitemaps output is
-# compatible with downstream tools (parse, etc.).
-PAGE_SCHEMA = avro_schema(
-    {
-        "name": "Page",
-        "type": "record",
-        "fields": [
-            {"name": "url", "type": "string"},
-            {"name": "timestamp", "type": "long"},
-            {"name": "body", "type": ["null", "string"], "default": None},
-            {"name": "error", "type": ["null", "string"], "default": None},
-            {
-                "name": "metadata",
-                "type": [
-                    "null",
-                    {
-                        "type": "map",
-                        "values": ["null", "string"],
-                    },
-                ],
-                "default": None,
-            },
-        ],
-    }
-)
-
 # Schema for the --output Avro format.
 # url is required (compatible with CrawlTool's InputFormat.AVRO);
 # the standard sitemap metadata fields are optional.
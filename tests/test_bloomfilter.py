@@ -2,6 +2,10 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import io
+
+import pytest
+
 from rubbernecker.crawl.bloomfilter import BloomFilter
 
 
@@ -10,13 +14,17 @@ class TestBloomFilter:
         bf = BloomFilter()
         assert bf.size == 15_000_000
         assert bf.hash_count == 9
-        assert len(bf.bit_array) == 15_000_000
+        assert len(bf.bit_array) == 1_875_000
 
     def test_custom_initialization(self):
         bf = BloomFilter(size=1000, hash_count=5)
         assert bf.size == 1000
         assert bf.hash_count == 5
-        assert len(bf.bit_array) == 1000
+        assert len(bf.bit_array) == 125
+
+    def test_bit_array_rounds_up_to_whole_bytes(self):
+        bf = BloomFilter(size=1001, hash_count=5)
+        assert len(bf.bit_array) == 126
 
     def test_str_representation(self):
         bf = BloomFilter(size=100, hash_count=3)
@@ -67,3 +75,96 @@ class TestBloomFilter:
         assert len(hashes) == 3
         for h in hashes:
             assert 0 <= h < 1000
+
+    def test_add_many_and_check_many(self):
+        bf = BloomFilter(size=10000, hash_count=5)
+        bf.add_many(["apple", "banana", "cherry"])
+        assert bf.check_many(["apple", "banana", "cherry", "durian"]) == [
+            True,
+            True,
+            True,
+            False,
+        ]
+
+    def test_check_many_matches_check(self):
+        bf = BloomFilter(size=1000, hash_count=3)
+        bf.add("test_item")
+        items = ["test_item", "nonexistent"]
+        assert bf.check_many(items) == [bf.check(item) for item in items]
+
+    def test_to_bytes_round_trip(self):
+        bf = BloomFilter(size=1000, hash_count=3)
+        bf.add("test_item")
+        restored = BloomFilter.from_bytes(bf.to_bytes())
+        assert restored.size == 1000
+        assert restored.hash_count == 3
+        assert restored.bit_array == bf.bit_array
+        assert restored.check("test_item") is True
+        assert restored.check("nonexistent") is False
+
+    def test_dump_and_load(self):
+        bf = BloomFilter(size=1000, hash_count=3)
+        bf.add("test_item")
+        buf = io.BytesIO()
+        bf.dump(buf)
+        buf.seek(0)
+        restored = BloomFilter.load(buf)
+        assert restored.bit_array == bf.bit_array
+
+    def test_from_bytes_truncated(self):
+        bf = BloomFilter(size=1000, hash_count=3)
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(bf.to_bytes()[:-1])
+
+    def test_optimal_parameters_rounding(self):
+        size, hash_count = BloomFilter.optimal_parameters(n=1_000_000, p=0.001)
+        assert size == 14_377_588
+        assert hash_count == 10
+
+    @pytest.mark.parametrize("n,p", [(0, 0.01), (1000, 0), (1000, 1)])
+    def test_optimal_parameters_invalid(self, n, p):
+        with pytest.raises(ValueError):
+            BloomFilter.optimal_parameters(n, p)
+
+    def test_with_capacity(self):
+        bf = BloomFilter.with_capacity(n=1000, p=0.01)
+        assert (bf.size, bf.hash_count) == BloomFilter.optimal_parameters(1000, 0.01)
+        assert bf.hash_count == 7
+
+    def test_merge(self):
+        bf1 = BloomFilter(size=1001, hash_count=3)
+        bf2 = BloomFilter(size=1001, hash_count=3)
+        bf1.add("item1")
+        bf2.add("item2")
+        bf1.merge(bf2)
+        assert bf1.check_many(["item1", "item2", "item3"]) == [True, True, False]
+        assert bf2.check("item1") is False
+
+    def test_merge_mismatched(self):
+        with pytest.raises(ValueError):
+            BloomFilter(size=1000, hash_count=3).merge(BloomFilter(size=1000))
+
+    def test_blake2b_hash(self):
+        bf = BloomFilter(size=1000, hash_count=3, hash_name="blake2b")
+        bf.add("test_item")
+        restored = BloomFilter.from_bytes(bf.to_bytes())
+        assert restored.hash_name == "blake2b"
+        assert restored.check("test_item") is True
+
+    def test_xxh3_hash(self):
+        pytest.importorskip("xxhash")
+        bf = BloomFilter(size=1000, hash_count=3, hash_name="xxh3")
+        bf.add_many(["apple", "banana"])
+        assert bf.check_many(["apple", "banana", "cherry"]) == [True, True, False]
+        assert BloomFilter.from_bytes(bf.to_bytes()).hash_name == "xxh3"
+
+    def test_unsupported_hash(self):
+        with pytest.raises(ValueError):
+            BloomFilter(size=1000, hash_name="md5")
+
+    def test_merge_mismatched_hash(self):
+        pytest.importorskip("xxhash")
+        with pytest.raises(ValueError):
+            BloomFilter(size=1000, hash_name="blake2b").merge(
+                BloomFilter(size=1000, hash_name="xxh3")
+            )
@@ -5,9 +5,12 @@
 import re
 from unittest.mock import MagicMock
 
+import pytest
+
 from rubbernecker.crawl.actions import (
     CrawlActionName,
     CrawlActionPlan,
+    CrawlActionPlanSet,
     crawl_action,
     parse_crawl_action_plans,
 )
@@ -55,3 +58,85 @@ def test_parse_crawl_action_plans():
     action, args = plan.actions[3]
     action.run(driver, args)
     driver.click.assert_called_once_with("a.morelink")
+
+
+def test_crawl_action_plan_set_matching():
+    script = """
+    [example\\.com]
+    sleep 1
+    [example\\.com/news]
+    scroll 100
+    [(a)\\1\\.org]
+    scroll 200
+    """
+    plans = parse_crawl_action_plans(script)
+    plan_set = CrawlActionPlanSet(plans)
+    assert plan_set.matching("https://example.com/") == [plans[0]]
+    assert plan_set.matching("https://example.com/news") == [plans[0], plans[1]]
+    assert plan_set.matching("https://aa.org/") == [plans[2]]
+    assert plan_set.matching("https://other.net/") == []
+    assert CrawlActionPlanSet(plans[:2]).matching("https://other.net/") == []
+
+
+def test_crawl_action_plan_run_stops_on_failure():
+    first = MagicMock()
+    first.run.return_value = False
+    second = MagicMock()
+    plan = CrawlActionPlan(
+        url_pattern=re.compile(".*"), actions=[(first, ["a"]), (second, ["b"])]
+    )
+    driver = MagicMock()
+    assert plan.run(driver) is False
+    first.run.assert_called_once_with(driver, args=["a"])
+    second.run.assert_not_called()
+
+
+def test_crawl_action_plan_run_picks_up_changed_actions():
+    first = MagicMock()
+    second = MagicMock()
+    plan = CrawlActionPlan(url_pattern=re.compile(".*"), actions=[(first, ["a"])])
+    plan.actions.append((second, ["b"]))
+    plan.actions[0][1].append("c")
+    driver = MagicMock()
+    assert plan.run(driver) is True
+    first.run.assert_called_once_with(driver, args=["a", "c"])
+    second.run.assert_called_once_with(driver, args=["b"])
+
+
+def test_parse_crawl_action_plans_blank_lines():
+    script = """
+    [example\\.com]
+    sleep 1
+
+    click\ta.more  link
+    """
+    plans = parse_crawl_action_plans(script)
+    assert plans[0].actions == [
+        (crawl_action(CrawlActionName.SLEEP), ["1"]),
+        (crawl_action(CrawlActionName.CLICK), ["a.more", "link"]),
+    ]
+
+
+def test_parse_crawl_action_plans_unknown_action():
+    with pytest.raises(ValueError, match="Unknown action: hover"):
+        parse_crawl_action_plans("[example\\.com]\nhover a.menu")
+
+
+@pytest.mark.parametrize(
+    "pattern,url,expected",
+    [
+        (r"news\.ycombinator\.com", "https://news.ycombinator.com/", True),
+        (r"news\.ycombinator\.com", "https://example.com/", False),
+        (r"^https://example\.com/", "https://example.com/page", True),
+        (r"^https://example\.com/", "http://example.com/page", False),
+        (r"^https?://example\.com/", "http://example.com/page", True),
+        (r"example\.com/items?", "https://example.com/item", True),
+        (r"^{x}", "{x}", True),
+        (r"(?i)EXAMPLE\.com", "https://example.com/", True),
+        (r"foo|example\.com", "https://example.com/", True),
+        (r"\d+\.html$", "https://example.com/42.html", True),
+    ],
+)
+def test_crawl_action_plan_should_run(pattern, url, expected):
+    plan = CrawlActionPlan(url_pattern=re.compile(pattern), actions=[])
+    assert plan.should_run(url) is expected
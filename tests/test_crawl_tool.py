@@ -2,17 +2,37 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import argparse
 import json
+import logging
 import os
 import tempfile
-
-from avrokit import avro_schema, avro_writer, parse_url
-
-from rubbernecker.crawl.bloomfilter import BloomFilter
+from unittest.mock import MagicMock, patch
+from urllib.parse import urlsplit
+
+import pytest
+from avro.errors import AvroTypeException
+from avrokit import avro_reader, avro_schema, avro_writer, parse_url
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    TimeoutException,
+)
+
+from rubbernecker.base import batched_avro_writer
+from rubbernecker.crawl.bloomfilter import (
+    DEFAULT_HASH_COUNT,
+    DEFAULT_SIZE,
+    BloomFilter,
+)
 from rubbernecker.crawl.tool import CrawlTool, InputFormat
 
 
 class TestCrawlToolBloomFilterKey:
+    def test_url_with_path_params(self):
+        tool = CrawlTool()
+        key = tool.bloom_filter_key("https://example.com/page;jsessionid=1")
+        assert key == "example.com:/page;jsessionid=1:"
+
     def test_simple_url(self):
         tool = CrawlTool()
         key = tool.bloom_filter_key("https://example.com/page")
@@ -40,6 +60,32 @@ class TestCrawlToolBloomFilterKey:
         key = tool.bloom_filter_key("https://example.com:8080/page")
         assert key == "example.com:8080:/page:"
 
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "https://example.com/page?foo=bar#section",
+            "https://example.com/page?",
+            "https://user:pw@Example.com:8080/a/b/?x=1&y=2",
+            "https://example.com/a;jsessionid=123?x=1",
+            "example.com/page",
+            "file:///tmp/page.html",
+            "https://example.com/a b",
+            "https://example.com/a\tb",
+        ],
+    )
+    def test_matches_urlsplit(self, url):
+        tool = CrawlTool()
+        parsed_url = urlsplit(url.lower())
+        expected = f"{parsed_url.netloc}:{parsed_url.path}:{parsed_url.query}"
+        assert tool.bloom_filter_key(url) == expected
+
+    def test_bloom_filter_keys(self):
+        tool = CrawlTool()
+        urls = ["https://EXAMPLE.com/a?x=1", "example.com/page", "https://example.com"]
+        assert tool.bloom_filter_keys(urls) == [
+            tool.bloom_filter_key(url) for url in urls
+        ]
+
 
 class TestCrawlToolLoadBloomFilter:
     def test_load_empty_file(self):
@@ -56,6 +102,173 @@ class TestCrawlToolLoadBloomFilter:
             bf = tool.load_bloom_filter(output_url)
             assert bf is None
 
+    def test_load_skips_error_records(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append(
+                    {
+                        "url": "https://example.com/page1",
+                        "timestamp": 1,
+                        "body": "<html/>",
+                    }
+                )
+                writer.append(
+                    {
+                        "url": "https://example.com/page2",
+                        "timestamp": 2,
+                        "error": "Failed",
+                    }
+                )
+
+            tool = CrawlTool()
+            bf = tool.load_bloom_filter(output_url)
+            assert bf is not None
+            assert bf.check("example.com:/page1:") is True
+            assert bf.check("example.com:/page2:") is False
+
+    def test_load_uses_bloom_key(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append(
+                    {
+                        "url": "https://example.com/page1",
+                        "timestamp": 1,
+                        "bloom_key": "precomputed",
+                    }
+                )
+
+            bf = CrawlTool().load_bloom_filter(output_url)
+            assert bf is not None
+            assert bf.check("precomputed") is True
+            assert bf.check("example.com:/page1:") is False
+
+    def test_load_saved_bloom_filter(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append({"url": "https://example.com/page1", "timestamp": 1})
+
+            tool = CrawlTool()
+            saved = tool.create_bloom_filter(capacity=100, error_rate=0.01)
+            saved.add("example.com:/saved:")
+            tool.save_bloom_filter(saved, output_url)
+            assert os.path.exists(os.path.join(tmpdir, "output.avro.bloom"))
+
+            bf = tool.load_bloom_filter(output_url, capacity=100, error_rate=0.01)
+            assert bf is not None
+            assert bf.check("example.com:/saved:") is True
+
+    def test_load_saved_bloom_filter_with_other_capacity(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append({"url": "https://example.com/page1", "timestamp": 1})
+
+            tool = CrawlTool()
+            tool.save_bloom_filter(
+                tool.create_bloom_filter(capacity=100, error_rate=0.01), output_url
+            )
+
+            # The saved filter is rebuilt at the new size
+            bf = tool.load_bloom_filter(output_url, capacity=1000, error_rate=0.01)
+            assert bf is not None
+            assert (bf.size, bf.hash_count) == BloomFilter.optimal_parameters(
+                1000, 0.01
+            )
+            assert bf.check("example.com:/page1:") is True
+
+    def test_load_saved_bloom_filter_with_other_hash(self):
+        pytest.importorskip("xxhash")
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append({"url": "https://example.com/page1", "timestamp": 1})
+
+            tool = CrawlTool()
+            tool.save_bloom_filter(
+                BloomFilter(DEFAULT_SIZE, DEFAULT_HASH_COUNT, "blake2b"), output_url
+            )
+
+            # The saved filter is rebuilt with the default hash
+            bf = tool.load_bloom_filter(output_url)
+            assert bf is not None
+            assert bf.hash_name == "xxh3"
+            assert bf.check("example.com:/page1:") is True
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            ["--bloom_filter_capacity", "0"],
+            ["--bloom_filter_error_rate", "0"],
+            ["--bloom_filter_error_rate", "1"],
+        ],
+    )
+    def test_invalid_bloom_filter_options(self, args):
+        parser = argparse.ArgumentParser()
+        CrawlTool().configure(parser.add_subparsers())
+        with pytest.raises(SystemExit):
+            parser.parse_args(["crawl", "input.txt", "output.avro", *args])
+
+    def test_load_stale_saved_bloom_filter(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+            with avro_writer(output_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append({"url": "https://example.com/page1", "timestamp": 1})
+
+            tool = CrawlTool()
+            tool.save_bloom_filter(BloomFilter(size=1000, hash_count=3), output_url)
+
+            with avro_writer(output_url.with_mode("a+b"), SCHEMA) as writer:
+                writer.append({"url": "https://example.com/page2", "timestamp": 2})
+
+            bf = tool.load_bloom_filter(output_url)
+            assert bf is not None
+            assert bf.check("example.com:/page1:") is True
+            assert bf.check("example.com:/page2:") is True
+
+    def test_load_sharded_output(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = os.path.join(tmpdir, "output")
+            os.mkdir(output_dir)
+            for i in range(3):
+                shard_url = parse_url(os.path.join(output_dir, f"part-{i}.avro"))
+                with avro_writer(shard_url.with_mode("wb"), SCHEMA) as writer:
+                    writer.append(
+                        {"url": f"https://example.com/page{i}", "timestamp": i}
+                    )
+
+            bf = CrawlTool().load_bloom_filter(parse_url(output_dir))
+            assert bf is not None
+            assert bf.check_many([f"example.com:/page{i}:" for i in range(4)]) == [
+                True,
+                True,
+                True,
+                False,
+            ]
+
+    def test_bloom_filter_url_for_glob(self):
+        tool = CrawlTool()
+        assert tool.bloom_filter_url(parse_url("/tmp/output/*.avro")) is None
+        bloom_filter_url = tool.bloom_filter_url(parse_url("/tmp/output/"))
+        assert bloom_filter_url is not None
+        assert bloom_filter_url.url.endswith("/tmp/output.bloom")
+
 
 class TestCrawlToolLoadRequests:
     def test_load_text_format(self):
@@ -86,7 +299,11 @@ class TestCrawlToolLoadRequests:
             assert "" in urls
             assert "https://example.com/page2" in urls
 
-    def test_load_json_format(self):
+    @pytest.mark.parametrize("stdlib_json", [False, True])
+    def test_load_json_format(self, stdlib_json, monkeypatch):
+        if stdlib_json:
+            # As when orjson isn't installed
+            monkeypatch.setattr("rubbernecker.crawl.tool.json_loads", json.loads)
         with tempfile.TemporaryDirectory() as tmpdir:
             input_url = parse_url(os.path.join(tmpdir, "requests.jsonl"))
             with input_url.with_mode("w") as f:
@@ -133,6 +350,23 @@ class TestCrawlToolLoadRequests:
             assert len(urls) == 1
             assert "https://example.com/page2" in urls
 
+    def test_load_with_bloom_filter_excludes_repeated_urls(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_url = parse_url(os.path.join(tmpdir, "requests.txt"))
+            with input_url.with_mode("w") as f:
+                f.write("https://example.com/page1\n")
+                f.write("https://EXAMPLE.com/page1\n")
+                f.write("https://example.com/page2\n")
+                f.write("https://example.com/page1\n")
+
+            tool = CrawlTool()
+            urls = list(
+                tool.load_requests(
+                    input_url, InputFormat.TEXT, bloom_filter=BloomFilter(1000, 3)
+                )
+            )
+            assert urls == ["https://example.com/page1", "https://example.com/page2"]
+
     def test_load_avro_with_error_records(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             input_url = parse_url(os.path.join(tmpdir, "requests.avro"))
@@ -155,6 +389,201 @@ class TestCrawlToolLoadRequests:
             urls = list(tool.load_requests(input_url, InputFormat.AVRO))
             assert len(urls) == 2
 
+    def test_load_avro_page_records(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_url = parse_url(os.path.join(tmpdir, "requests.avro"))
+            with avro_writer(
+                input_url.with_mode("wb"), SCHEMA, codec="deflate"
+            ) as writer:
+                writer.append(
+                    {
+                        "url": "https://example.com/page1",
+                        "timestamp": 1,
+                        "body": "<html>" + "x" * 10_000 + "</html>",
+                    }
+                )
+                writer.append(
+                    {
+                        "url": "https://example.com/page2",
+                        "timestamp": 2,
+                        "error": "Failed",
+                    }
+                )
+
+            tool = CrawlTool()
+            urls = list(tool.load_requests(input_url, InputFormat.AVRO))
+            assert urls == ["https://example.com/page1", "https://example.com/page2"]
+
+    def test_load_avro_uses_bloom_key(self):
+        from rubbernecker.crawl.tool import SCHEMA
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_url = parse_url(os.path.join(tmpdir, "requests.avro"))
+            with avro_writer(input_url.with_mode("wb"), SCHEMA) as writer:
+                writer.append(
+                    {
+                        "url": "https://example.com/page1",
+                        "timestamp": 1,
+                        "bloom_key": "precomputed",
+                    }
+                )
+                writer.append({"url": "https://example.com/page2", "timestamp": 2})
+
+            tool = CrawlTool()
+            bf = BloomFilter(size=1000, hash_count=3)
+            bf.add("precomputed")
+            bf.add(tool.bloom_filter_key("https://example.com/page2"))
+            urls = list(tool.load_requests(input_url, InputFormat.AVRO, bf))
+            assert urls == []
+
+
+class TestCrawlToolBrowserDead:
+    class _Driver:
+        def __init__(self, alive: bool):
+            self.alive = alive
+            self.probes = 0
+
+        @property
+        def current_url(self):
+            self.probes += 1
+            if not self.alive:
+                raise InvalidSessionIdException("session deleted")
+            return "https://example.com"
+
+    def test_session_error_does_not_probe(self):
+        driver = self._Driver(alive=True)
+        assert CrawlTool().is_browser_dead(driver, InvalidSessionIdException())
+        assert driver.probes == 0
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            TimeoutException(),
+            ConnectionRefusedError(),
+            Exception("CDP connection closed"),
+        ],
+    )
+    @pytest.mark.parametrize("alive", [True, False])
+    def test_other_errors_probe(self, alive, error):
+        driver = self._Driver(alive=alive)
+        assert CrawlTool().is_browser_dead(driver, error) is not alive
+        assert driver.probes == 1
+
+    def test_missing_driver(self):
+        assert CrawlTool().is_browser_dead(None, ValueError("no driver"))
+
+
+def test_batched_avro_writer():
+    from rubbernecker.crawl.tool import SCHEMA
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+        with pytest.raises(RuntimeError):
+            with batched_avro_writer(
+                output_url.with_mode("wb"), SCHEMA, batch_size=2
+            ) as writer:
+                for i in range(5):
+                    writer.append({"url": f"https://example.com/{i}", "timestamp": i})
+                assert writer.pending == 1
+                raise RuntimeError("crawl failed")
+
+        # Buffered records are still written when the crawl fails
+        with batched_avro_writer(
+            output_url.with_mode("a+b"), SCHEMA, batch_size=2
+        ) as writer:
+            writer.append({"url": "https://example.com/5", "timestamp": 5})
+
+        with avro_reader(output_url.with_mode("rb")) as reader:
+            assert [record["timestamp"] for record in reader] == list(range(6))
+
+
+def test_batched_avro_writer_invalid_record():
+    from rubbernecker.crawl.tool import SCHEMA
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+        with batched_avro_writer(
+            output_url.with_mode("wb"), SCHEMA, batch_size=4
+        ) as writer:
+            for i in range(3):
+                writer.append({"url": f"https://example.com/{i}", "timestamp": i})
+            with pytest.raises(AvroTypeException):
+                writer.append({"url": None, "timestamp": 3})
+            writer.append({"url": "https://example.com/4", "timestamp": 4})
+            writer.append({"url": "https://example.com/5", "timestamp": 5})
+
+        with avro_reader(output_url.with_mode("rb")) as reader:
+            assert [record["timestamp"] for record in reader] == [0, 1, 2, 4, 5]
+
+
+def test_batched_avro_writer_max_block_bytes():
+    from rubbernecker.crawl.tool import SCHEMA
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+        with batched_avro_writer(
+            output_url.with_mode("wb"), SCHEMA, batch_size=100, max_block_bytes=1000
+        ) as writer:
+            for i in range(10):
+                writer.append(
+                    {"url": "https://example.com/", "timestamp": i, "body": "x" * 400}
+                )
+                # Blocks are written out once they pass max_block_bytes
+                assert writer.pending <= 2
+
+        with avro_reader(output_url.with_mode("rb")) as reader:
+            assert len(list(reader)) == 10
+
+
+class TestCrawlToolGetPageSource:
+    class _Driver:
+        def __init__(self, html: str):
+            self.html = html
+
+        def execute_cdp_cmd(self, cmd, params):
+            assert cmd == "Runtime.evaluate"
+            limit = int(params["expression"].split("html.slice(0, ")[1].split(")")[0])
+            # Lengths and slices count UTF-16 code units, as in JavaScript
+            units = self.html.encode("utf-16-le", errors="surrogatepass")
+            body = units[: limit * 2].decode("utf-16-le", errors="surrogatepass")
+            return {"result": {"value": [len(units) // 2, body]}}
+
+    class _SB:
+        def __init__(self, html: str):
+            self.driver = TestCrawlToolGetPageSource._Driver(html)
+
+        def get_page_source(self):
+            return self.driver.html
+
+        def get_current_url(self):
+            return "https://example.com"
+
+    @pytest.mark.parametrize(
+        "html,max_body_bytes,expected",
+        [
+            ("<html></html>", None, "<html></html>"),
+            ("<html></html>", 100, "<html></html>"),
+            ("<html></html>", 6, "<html>"),
+            # Multi-byte characters are never split
+            ("<p>éé</p>", 6, "<p>é"),
+            # Nor are surrogate pairs, which JavaScript may slice in half
+            ("<p>\ud83d\ude00</p>", 4, "<p>"),
+        ],
+    )
+    def test_get_page_source(self, html, max_body_bytes, expected):
+        tool = CrawlTool()
+        assert tool.get_page_source(self._SB(html), max_body_bytes) == expected
+
+    def test_get_page_source_astral_not_truncated(self, caplog):
+        # Surrogate pairs count twice in JavaScript lengths, as they do in the limit
+        html = "<p>\U0001f600</p>"
+        tool = CrawlTool()
+        with caplog.at_level(logging.WARNING):
+            assert tool.get_page_source(self._SB(html), 100) == html
+        assert "Truncating" not in caplog.text
+
 
 class TestCrawlToolStats:
     def test_default_stats(self):
@@ -172,3 +601,64 @@ class TestCrawlToolStats:
         assert stats.count_input == 10
         assert stats.count_output == 8
         assert stats.count_error == 2
+
+
+class _FakeSB:
+    """Stands in for SeleniumBase, failing navigation to URLs containing 'fail'."""
+
+    def __init__(self, **kwargs):
+        self.driver = MagicMock()
+        self.driver.execute_cdp_cmd.side_effect = self._navigate
+        self.url = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def _navigate(self, cmd, params):
+        self.activate_cdp_mode(params["url"])
+
+    def activate_cdp_mode(self, url):
+        if "fail" in url:
+            raise TimeoutException("timed out")
+        self.url = url
+
+    def wait_for_ready_state_complete(self):
+        pass
+
+    def get_current_url(self):
+        return self.url
+
+    def get_page_source(self):
+        return f"<html>{self.url}</html>"
+
+
+def test_crawl_retries_and_records_errors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_url = parse_url(os.path.join(tmpdir, "urls.txt"))
+        with input_url.with_mode("w") as f:
+            f.write("https://example.com/a\nhttps://example.com/fail\n")
+        output_url = parse_url(os.path.join(tmpdir, "output.avro"))
+
+        with patch("rubbernecker.crawl.tool.SB", _FakeSB):
+            stats = CrawlTool().crawl(
+                input_url,
+                output_url,
+                sleep_success=0,
+                sleep_error=0,
+                max_retries=1,
+                use_bloom_filter=True,
+            )
+
+        assert (stats.count_input, stats.count_output, stats.count_error) == (2, 1, 2)
+        with avro_reader(output_url.with_mode("rb")) as reader:
+            records = list(reader)
+        assert [(r["url"], r["error"]) for r in records] == [
+            ("https://example.com/a", None),
+            ("https://example.com/fail", "Message: timed out\n"),
+            ("https://example.com/fail", "Message: timed out\n"),
+        ]
+        assert records[0]["body"] == "<html>https://example.com/a</html>"
+        assert records[0]["bloom_key"] == "example.com:/a:"
@@ -2,12 +2,17 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import io
 import os
 import tempfile
+from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
 from avrokit import parse_url
+from requests.adapters import HTTPAdapter
 
+from rubbernecker.crawl.bloomfilter import BloomFilter
 from rubbernecker.fetch import FetchTool
 
 
@@ -65,3 +70,105 @@ def test_fetch_tool_parallel():
         with open(json_path) as f:
             content = f.read()
         assert '"slideshow"' in content
+
+
+def test_fetch_tool_skips_existing_before_fetching():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_url = parse_url(os.path.join(tmpdir, "urls.txt"))
+        output_url = parse_url(os.path.join(tmpdir, "output"))
+
+        os.makedirs(os.path.join(tmpdir, "output", "image"))
+        with open(os.path.join(tmpdir, "output", "image", "png"), "wb") as f:
+            f.write(b"\x89PNG")
+
+        with input_url.with_mode("w") as f:
+            f.write("https://example.com/image/png\n")
+            f.write("\n")
+            for i in range(20):
+                f.write(f"https://example.com/page/{i}\n")
+
+        tool = FetchTool()
+        with patch.object(tool, "fetch_url", return_value=(True, False)) as fetch_url:
+            stats = tool.fetch(input_url, output_url, parallelism=2)
+
+        assert stats.count_input == 21
+        assert stats.count_output == 20
+        assert stats.count_skipped == 1
+        assert stats.count_error == 0
+        fetched = {call.args[0] for call in fetch_url.call_args_list}
+        assert "https://example.com/image/png" not in fetched
+        assert len(fetched) == 20
+
+
+def test_create_session_pool_size():
+    tool = FetchTool()
+    with tool.create_session(8) as session:
+        adapter = session.get_adapter("https://example.com/")
+        assert isinstance(adapter, HTTPAdapter)
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 8
+        assert adapter.max_retries.total == 2
+
+
+def _response(raw) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = raw
+    return response
+
+
+def test_fetch_url_streams_to_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_url = parse_url(os.path.join(tmpdir, "output"))
+        content = os.urandom(200_000)
+        session = MagicMock()
+        session.get.return_value = _response(io.BytesIO(content))
+
+        tool = FetchTool()
+        result = tool.fetch_url(
+            "https://example.com/a/b.bin", output_url, False, None, session
+        )
+
+        assert result == (True, False)
+        assert session.get.call_args.kwargs["stream"] is True
+        with open(os.path.join(tmpdir, "output", "a", "b.bin"), "rb") as f:
+            assert f.read() == content
+
+
+def test_fetch_url_removes_partial_output():
+    class FailingRaw(io.BytesIO):
+        def read(self, *args):
+            if self.tell() > 0:
+                raise OSError("connection reset")
+            return super().read(*args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_url = parse_url(os.path.join(tmpdir, "output"))
+        session = MagicMock()
+        session.get.return_value = _response(FailingRaw(os.urandom(200_000)))
+
+        tool = FetchTool()
+        result = tool.fetch_url(
+            "https://example.com/a/b.bin", output_url, False, None, session
+        )
+
+        assert result == (False, False)
+        assert not os.path.exists(os.path.join(tmpdir, "output", "a", "b.bin"))
+
+
+def test_fetch_tool_adds_fetched_paths_to_bloom_filter():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_url = parse_url(os.path.join(tmpdir, "urls.txt"))
+        output_url = parse_url(os.path.join(tmpdir, "output"))
+        with input_url.with_mode("w") as f:
+            for i in range(10):
+                f.write(f"https://example.com/page/{i}\n")
+
+        bloom_filter = BloomFilter(size=1000, hash_count=3)
+        tool = FetchTool()
+        with (
+            patch.object(tool, "load_bloom_filter", return_value=bloom_filter),
+            patch.object(tool, "fetch_url", return_value=(True, False)),
+        ):
+            tool.fetch(input_url, output_url, parallelism=4)
+
+        assert bloom_filter.check_many([f"page/{i}" for i in range(10)]) == [True] * 10